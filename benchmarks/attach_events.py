@@ -0,0 +1,79 @@
+"""
+Micro-benchmark of attachEvents against the nested loop it replaced, on synthetic days of automatic events. Run with python benchmarks/attach_events.py with NorLyst installed.
+"""
+import time
+import types
+
+from norlyst.misc import EventClassification, attachEvents
+
+def attachEventsNestedLoop(event_classifications, events):
+    """
+    Function for attaching NordicEvents to the event classifications with the nested loop that attachEvents replaced. Only used as the baseline of benchmarkAttachEvents.
+    """
+    for event in events:
+        for e_classification in event_classifications:
+            if e_classification.event_id == event.event_id:
+                e_classification.setEvent(event)
+                break
+            elif e_classification.analysis_id == event.event_id:
+                e_classification.setAnalysis(event)
+
+def createBenchmarkDay(event_count):
+    """
+    Function for creating the event classifications and events of a synthetic day with event_count automatic events where every fifth event has an analysis
+    """
+    event_classifications = []
+    events = []
+
+    for i in range(event_count):
+        event_id = i + 1
+        analysis_id = -1
+
+        events.append(createBenchmarkEvent(event_id))
+
+        if i % 5 == 0:
+            analysis_id = event_count + event_id
+            events.append(createBenchmarkEvent(analysis_id))
+
+        event_classifications.append(EventClassification(i + 1, 1, 1, event_id, None, None, None, None, analysis_id, False, False, None))
+
+    return event_classifications, events
+
+def createBenchmarkEvent(event_id):
+    """
+    Function for creating a stand-in for a NordicEvent with the attributes createEventHeader reads
+    """
+    value = types.SimpleNamespace(val = None)
+
+    return types.SimpleNamespace(
+        event_id = event_id,
+        waveform_h = [],
+        getOriginTime = lambda: None,
+        getLatitude = lambda: value,
+        getLongitude = lambda: value,
+        getMagnitude = lambda: value
+    )
+
+def benchmarkAttachEvents(event_counts = (1000, 10000), repeats = 3):
+    """
+    Function for comparing attachEvents and the old nested loop on synthetic days of event_counts automatic events
+    """
+    for event_count in event_counts:
+        event_classifications, events = createBenchmarkDay(event_count)
+
+        results = []
+        for attach_function in [attachEventsNestedLoop, attachEvents]:
+            start_time = time.perf_counter()
+            for i in range(repeats):
+                attach_function(event_classifications, events)
+            results.append((time.perf_counter() - start_time) / repeats)
+
+        print('{0:6d} events: nested loop {1:8.4f} s, indexed {2:8.5f} s, {3:7.0f}x'.format(
+            event_count,
+            results[0],
+            results[1],
+            results[0] / results[1]
+        ))
+
+if __name__ == '__main__':
+    benchmarkAttachEvents()
@@ -58,15 +58,54 @@ SPECTRO_SEGMENT_LENGTH = 0.05
 SPECTRO_SEGMENT_OVERLAP = 0.9
 SPECTRO_WINDOW_OFFSET = timedelta(seconds = 20)
 SPECTRO_WINDOW_SIZE =  timedelta(seconds = 90)
+SPECTRO_COLOR_MAP = 'hsv'
+SPECTRO_COLOR_LUT_SIZE = 256
+SPECTRO_CHUNK_SIZE = 32
+SPECTRO_PROCESS_COUNT = 4
+SPECTRO_GRID_COLUMNS = 4
+SPECTRO_GRID_PLOT_WIDTH = 250
+SPECTRO_GRID_PLOT_HEIGHT = 300
 
 FILTER_TAPER_VALUE = 0.05
+FILTER_CORNERS = 4
 
 PROJECT_FILE_PATH = os.path.dirname(os.path.abspath(__file__))
 
 WAVEFORM_LOCATOR_CONFIG_FILE = os.path.dirname(os.path.realpath(__file__)) + "/waveform_locations.json"
 
-WAVEFORM_OLD_BUFFER_SIZE = 5
-WAVEFORM_PREDICTIVE_BUFFER_SIZE = 5
+WAVEFORM_CACHE_BYTE_BUDGET = 512 * 1024 * 1024
+FILTERED_TRACE_CACHE_BYTE_BUDGET = 256 * 1024 * 1024
+SPECTROGRAM_CACHE_BYTE_BUDGET = 64 * 1024 * 1024
+
+WAVEFORM_TRIM_ENABLED = True
+WAVEFORM_TRIM_PRE = timedelta(seconds = 30)
+WAVEFORM_TRIM_POST = timedelta(seconds = 120)
+
+WAVEFORM_FETCH_THREAD_COUNT = 3
+WAVEFORM_PARALLEL_STATION_READS = True
+WAVEFORM_STATION_READ_COUNT = 8
+
+WAVEFORM_PREDICTION_COUNT = 3
+WAVEFORM_PREDICTION_MAX = 5
+WAVEFORM_PREDICTION_TIME_WINDOW = timedelta(minutes = 10)
 
 MAX_PLOT_SIZE = 1
+TEXT_ITEM_DEFAULT_COLOR = (200, 200, 200)
+
+DATABASE_WRITE_RETRIES = 3
+DATABASE_WRITE_BACKOFF = 0.5
+
+DATABASE_POOL_SIZE = 4
+DATABASE_POOL_TIMEOUT = 30
+DATABASE_HEALTH_CHECK_INTERVAL = 60
+
+NORDIC_EVENT_PAGE_SIZE = 50
+
+NORLYST_CACHE_PATH = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'norlyst')
+
+EVENT_CACHE_FILE_PATH = os.path.join(NORLYST_CACHE_PATH, 'nordic_events.sqlite')
+EVENT_CACHE_MAX_SIZE = 256 * 1024 * 1024
+
 
+WAVEFORM_STORE_PATH = os.path.join(NORLYST_CACHE_PATH, 'waveforms')
+WAVEFORM_STORE_MAX_SIZE = 2 * 1024 * 1024 * 1024
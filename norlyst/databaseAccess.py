@@ -1,33 +1,202 @@
 """
 This module contains tools for accessing most of the important database operations.
 """
+import time
+import threading
+from contextlib import contextmanager
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from psycopg2 import Error, OperationalError, InterfaceError
+from psycopg2.extras import execute_values
+from psycopg2.pool import PoolError
+
 from nordb.core.usernameUtilities import log2nordb
 from nordb import getNordic
 
-from norlyst.misc import EventClassification
+from norlyst.eventCache import NordicEventCache
+from norlyst.databaseQueries import *
+from norlyst.misc import EventClassification, UpdateQueue, attachEvents, attachEventHeaders, createEventHeaderFromRow
+from norlyst.config import (DATABASE_WRITE_RETRIES, DATABASE_WRITE_BACKOFF, DATABASE_POOL_SIZE,
+                            DATABASE_POOL_TIMEOUT, DATABASE_HEALTH_CHECK_INTERVAL, NORDIC_EVENT_PAGE_SIZE)
+
+class ConnectionPool():
+    """
+    This class holds a bounded pool of connections to the nordb database. Connections that have been idle for a while are checked before they are handed out again.
+    """
+    def __init__(self, max_connections = DATABASE_POOL_SIZE):
+        self.max_connections = max_connections
+        self.__idle_connections = []
+        self.__connection_count = 0
+        self.__condition = threading.Condition()
+
+    def getConnection(self, timeout = DATABASE_POOL_TIMEOUT):
+        """
+        Check out a connection from the pool. A new connection is opened if there are no idle connections and the pool is not full, otherwise waits for a connection to be returned. Raises PoolError if no connection is available within the timeout.
+        """
+        deadline = time.monotonic() + timeout
+
+        while True:
+            conn = None
+
+            with self.__condition:
+                while not self.__idle_connections and self.__connection_count >= self.max_connections:
+                    if not self.__condition.wait(deadline - time.monotonic()):
+                        raise PoolError('No free database connections in the pool')
+
+                if self.__idle_connections:
+                    conn, idle_since = self.__idle_connections.pop()
+                else:
+                    self.__connection_count += 1
+
+            if conn is None:
+                try:
+                    return log2nordb()
+                except Exception:
+                    self.__removeConnection()
+                    raise
+
+            if self.__isHealthy(conn, idle_since):
+                return conn
+
+            self.putConnection(conn, discard = True)
+
+    def putConnection(self, conn, discard = False):
+        """
+        Return a connection to the pool. Broken connections and connections marked to be discarded are closed instead.
+        """
+        if not discard and not conn.closed:
+            try:
+                conn.rollback()
+            except Error:
+                discard = True
+
+        if discard or conn.closed:
+            try:
+                conn.close()
+            except Error:
+                pass
+            self.__removeConnection()
+            return
+
+        with self.__condition:
+            self.__idle_connections.append((conn, time.monotonic()))
+            self.__condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager for checking out a connection and returning it to the pool afterwards
+        """
+        conn = self.getConnection()
+        discard = False
+
+        try:
+            yield conn
+        except (OperationalError, InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.putConnection(conn, discard)
+
+    def closeAll(self):
+        """
+        Close all idle connections of the pool
+        """
+        with self.__condition:
+            for conn, idle_since in self.__idle_connections:
+                conn.close()
+            self.__connection_count -= len(self.__idle_connections)
+            self.__idle_connections.clear()
+
+    def __removeConnection(self):
+        """
+        Free the place of a closed connection in the pool
+        """
+        with self.__condition:
+            self.__connection_count -= 1
+            self.__condition.notify()
+
+    def __isHealthy(self, conn, idle_since):
+        """
+        Check that the connection is still usable. Connections that were used recently are trusted without a round trip to the database.
+        """
+        if conn.closed:
+            return False
+
+        if time.monotonic() - idle_since < DATABASE_HEALTH_CHECK_INTERVAL:
+            return True
+
+        try:
+            cur = conn.cursor()
+            cur.execute(HEALTH_CHECK)
+            conn.rollback()
+        except Error:
+            return False
+
+        return True
 
 class DatabaseAccesser():
     """
-    This class holds connection and access functions to the nordb database
+    This class holds connection and access functions to the nordb database. Every thread using the accesser gets its own connection from the connection pool. The local event cache is not used if use_event_cache is False.
     """
-    def __init__(self):
-        self.__conn = log2nordb()
+    def __init__(self, connection_pool = None, event_cache = None, use_event_cache = True):
+        if connection_pool is None:
+            connection_pool = ConnectionPool()
+
+        if event_cache is None and use_event_cache:
+            try:
+                event_cache = NordicEventCache()
+            except Exception as e:
+                print('Local event cache is disabled: {0}'.format(e))
+
+        self.connection_pool = connection_pool
+        self.event_cache = event_cache
+        self.__thread_connections = threading.local()
 
     def __del__(self):
-        self.__conn.close()
+        self.releaseConnection()
+        self.connection_pool.closeAll()
+
+    def getConnection(self):
+        """
+        Get the database connection of the current thread. The connection is checked out from the pool on the first call of each thread.
+        """
+        conn = getattr(self.__thread_connections, 'conn', None)
+
+        if conn is None or conn.closed:
+            if conn is not None:
+                self.connection_pool.putConnection(conn, discard = True)
+            conn = self.connection_pool.getConnection()
+            self.__thread_connections.conn = conn
+
+        return conn
+
+    def releaseConnection(self, discard = False):
+        """
+        Return the connection of the current thread to the pool. Threads that are about to finish should call this so that the connection can be reused.
+        """
+        conn = getattr(self.__thread_connections, 'conn', None)
+
+        if conn is None:
+            return
+
+        self.__thread_connections.conn = None
+        self.connection_pool.putConnection(conn, discard)
 
     def lockDayForUser(self, lock_date):
         """
         Function for locking a day for a single user. Returns True if locking was successful and False if not
         """
-        cur = self.__conn.cursor()
+        conn = self.getConnection()
+        cur = conn.cursor()
 
         current_user = self.getCurrentUser()
 
         cur.execute(LOCK_DAILY_LIST, {'daily_list_date': lock_date})
 
         ans = cur.fetchone()
-        self.__conn.commit()
+        conn.commit()
 
         if ans is None:
             return False
@@ -40,7 +209,8 @@ class DatabaseAccesser():
         """
         Get current database user
         """
-        cur = self.__conn.cursor()
+        conn = self.getConnection()
+        cur = conn.cursor()
 
         cur.execute(GET_CURRENT_USER)
 
@@ -50,12 +220,13 @@ class DatabaseAccesser():
         """
         Function for unlocking a day. Returns True if unlocking was succesful and False if not.
         """
-        cur = self.__conn.cursor()
+        conn = self.getConnection()
+        cur = conn.cursor()
 
         cur.execute(UNLOCK_DAILY_LIST, {'daily_list_date': lock_date})
 
         ans = cur.fetchone()
-        self.__conn.commit()
+        conn.commit()
 
         if ans is None:
             return False
@@ -66,7 +237,8 @@ class DatabaseAccesser():
         """
         Function for checking if the date is locked to this user. Each operation on event_classification and event_comment tables should call this before excuting
         """
-        cur = self.__conn.cursor()
+        conn = self.getConnection()
+        cur = conn.cursor()
 
         cur.execute(IS_DATE_LOCKED, {'daily_list_date':lock_date})
         ans = cur.fetchone()
@@ -78,25 +250,12 @@ class DatabaseAccesser():
         else:
             return False
 
-    def isEventLockedToUser(self, event_classification_id):
-        """
-        Function for checking if the event is locked to this user. Returns True if the user can modify the event and false if not.
-        """
-        cur = self.__conn.cursor()
-
-        cur.execute(IS_EVENT_CLASSIFICATION_LOCKED, {'event_classification_id':event_classification_id})
-        ans = cur.fetchone()
-
-        if ans is None:
-            return False
-
-        return ans[0]
-
     def getEventClassifications(self, daily_list_date, update_queue):
         """
-        Function for fetching event classifications and events from the database, inserting the events inside the classifications and returning them to the program. Returns None if no events are found.
+        Function for fetching event classifications and the headers of their events from the database. The full NordicEvents are not fetched here, use getNordicEvents or the NordicEventLoaderThread for loading them. Returns an empty list if no events are found.
         """
-        cur = self.__conn.cursor()
+        conn = self.getConnection()
+        cur = conn.cursor()
 
         cur.execute(GET_DAILY_LIST, {'daily_list_date': daily_list_date})
         ans = cur.fetchone()
@@ -118,27 +277,74 @@ class DatabaseAccesser():
             if ec_array[8] != -1:
                 event_ids.append(ec_array[8])
 
-        events = getNordic(event_ids, db_conn = self.__conn)
+        cur.execute(GET_EVENT_HEADERS, {'event_ids': event_ids})
+        event_headers = [createEventHeaderFromRow(header_row) for header_row in cur.fetchall()]
 
-        for event in events:
-            for e_classification in event_classifications:
-                if e_classification.event_id == event.event_id:
-                    e_classification.setEvent(event)
-                    break
-                elif e_classification.analysis_id == event.event_id:
-                    e_classification.setAnalysis(event)
+        attachEventHeaders(event_classifications, event_headers)
 
+        if self.event_cache is not None:
+            self.validateCachedEvents(daily_list_date, event_ids)
 
         return event_classifications
 
+    def validateCachedEvents(self, daily_list_date, event_ids):
+        """
+        Function for checking that the locally cached events of a daily list still match the database. The fingerprint consists of the event ids of the list and the count and largest id of their main and waveform header rows and their phase data rows. If it has changed the cached events of the list are removed.
+        """
+        conn = self.getConnection()
+        cur = conn.cursor()
+
+        cur.execute(GET_EVENT_FINGERPRINT, {'event_ids': event_ids})
+        fingerprint = "{0}:{1}".format(
+            ",".join(str(event_id) for event_id in sorted(event_ids)),
+            ",".join(str(value) for value in cur.fetchone())
+        )
+
+        if not self.event_cache.isDailyListValid(daily_list_date, fingerprint):
+            self.event_cache.removeEvents(event_ids)
+            self.event_cache.setDailyListFingerprint(daily_list_date, fingerprint)
+
+    def getNordicEvents(self, event_ids):
+        """
+        Function for fetching full NordicEvents with all picks and comments. Events are served from the local event cache when possible and the rest are fetched from the database and stored to the cache.
+        """
+        if not event_ids:
+            return []
+
+        if self.event_cache is None:
+            return getNordic(event_ids, db_conn = self.getConnection())
+
+        cached_events = self.event_cache.getEvents(event_ids)
+        missing_ids = [event_id for event_id in event_ids if event_id not in cached_events]
+
+        if not missing_ids:
+            return list(cached_events.values())
+
+        fetched_events = getNordic(missing_ids, db_conn = self.getConnection())
+        self.event_cache.putEvents(fetched_events)
+
+        return list(cached_events.values()) + fetched_events
+
+    def loadEventClassifications(self, event_classifications):
+        """
+        Function for fetching the NordicEvents of the given event classifications that have not been loaded yet and attaching them to the classifications.
+        """
+        event_ids = []
+
+        for ec in event_classifications:
+            if ec.event is None:
+                event_ids.append(ec.event_id)
+            if ec.analysis_id != -1 and ec.analysis is None:
+                event_ids.append(ec.analysis_id)
+
+        attachEvents(event_classifications, self.getNordicEvents(event_ids))
+
     def analysisIdUpdate(self, event_classification_id, analysis_id):
         """
         Function for updating the analysis_id in the database. Returns True if this was successful and False if not.
         """
-        if not self.isEventLockedToUser(event_classification_id):
-            return False
-
-        cur = self.__conn.cursor()
+        conn = self.getConnection()
+        cur = conn.cursor()
 
         cur.execute(UPDATE_ANALYSIS_ID, {'event_classification_id':event_classification_id, 'analysis_id': analysis_id})
         ans = cur.fetchone()
@@ -146,16 +352,15 @@ class DatabaseAccesser():
         if ans is None:
             return False
 
-        self.__conn.commit()
+        conn.commit()
         return ans[0]
 
     def priorityUpdate(self, event_classification_id, priority):
         """
         function for updating the priority value in the database. Returns True if this was successful and False if not.
         """
-        if not self.isEventLockedToUser(event_classification_id):
-            return False
-        cur = self.__conn.cursor()
+        conn = self.getConnection()
+        cur = conn.cursor()
 
         cur.execute(UPDATE_PRIORITY, {'event_classification_id':event_classification_id, 'priority': priority})
         ans = cur.fetchone()
@@ -163,17 +368,15 @@ class DatabaseAccesser():
         if ans is None:
             return False
 
-        self.__conn.commit()
+        conn.commit()
         return ans[0]
 
     def usernameUpdate(self, event_classification_id, username):
         """
         Function for updating the username value in the database. Returns True if this was successful and False if not.
         """
-        if not self.isEventLockedToUser(event_classification_id):
-            return False
-
-        cur = self.__conn.cursor()
+        conn = self.getConnection()
+        cur = conn.cursor()
 
         cur.execute(UPDATE_USERNAME, {'event_classification_id':event_classification_id, 'username': username})
         ans = cur.fetchone()
@@ -181,17 +384,15 @@ class DatabaseAccesser():
         if ans is None:
             return False
 
-        self.__conn.commit()
+        conn.commit()
         return ans[0]
 
     def setEventAsDone(self, event_classification_id, done):
         """
         Set event to be done.
         """
-        if not self.isEventLockedToUser(event_classification_id):
-            return False
-
-        cur = self.__conn.cursor()
+        conn = self.getConnection()
+        cur = conn.cursor()
 
         cur.execute(UPDATE_DONE, {'event_classification_id':event_classification_id})
         ans = cur.fetchone()
@@ -199,7 +400,7 @@ class DatabaseAccesser():
         if ans is None:
             return False
 
-        self.__conn.commit()
+        conn.commit()
         return ans[0]
 
 
@@ -207,10 +408,8 @@ class DatabaseAccesser():
         """
         Set event to be unimportant. Returns True if this was successful and False if not.
         """
-        if not self.isEventLockedToUser(event_classification_id):
-            return False
-
-        cur = self.__conn.cursor()
+        conn = self.getConnection()
+        cur = conn.cursor()
 
         cur.execute(UPDATE_UNIMPORTANT, {'event_classification_id':event_classification_id, 'unimportant': unimportant})
         ans = cur.fetchone()
@@ -218,196 +417,125 @@ class DatabaseAccesser():
         if ans is None:
             return False
 
-        self.__conn.commit()
+        conn.commit()
         return ans[0]
 
-GET_DAILY_LIST = """
-    SELECT
-        id, author_lock
-    FROM
-        daily_list
-    WHERE
-        daily_list_date = %(daily_list_date)s
-"""
-
-GET_EVENT_CLASSIFICATIONS = """
-    SELECT
-        id, daily_id, priority, event_id, classification, eqex, certainty, username, analysis_id, unimportant, done
-    FROM
-        event_classification
-    WHERE
-        daily_id = %(daily_list_id)s
-"""
-
-IS_DATE_LOCKED_TO_USER = """
-    SELECT
-        1
-    FROM
-        daily_list
-    WHERE
-        author_lock = CURRENT_USER
-    AND
-        daily_list_date = %(daily_list_date)s
-"""
-
-IS_DATE_LOCKED = """
-    SELECT
-        author_lock
-    FROM
-        daily_list
-    WHERE
-        daily_list_date = %(daily_list_date)s
-"""
+    def batchUpdate(self, update_events):
+        """
+        Function for writing a list of [operation, event_classification_id, value] updates to the database in a single transaction. Every operation type is written with one multi-row statement that also checks the daily lock. Returns a list of booleans telling which updates were successful in the same order as update_events.
+        """
+        if not update_events:
+            return []
 
-LOCK_DAILY_LIST = """
-    UPDATE
-        daily_list
-    SET
-        author_lock = COALESCE(author_lock, CURRENT_USER)
-    WHERE
-        daily_list_date = %(daily_list_date)s
-    RETURNING
-        author_lock
-"""
+        conn = self.getConnection()
+        cur = conn.cursor()
+
+        try:
+            operation_values = {}
+            for operation, event_classification_id, value in update_events:
+                if operation not in operation_values:
+                    operation_values[operation] = {}
+                operation_values[operation][event_classification_id] = value
+
+            updated_rows = set()
+            for operation, values in operation_values.items():
+                updated_ids = execute_values(
+                    cur,
+                    BATCH_UPDATE_OPERATIONS[operation],
+                    list(values.items()),
+                    fetch = True
+                )
+                updated_rows.update((operation, ans[0]) for ans in updated_ids)
+
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        return [(update_event[0], update_event[1]) in updated_rows for update_event in update_events]
+
+class DatabaseWriterThread(QThread):
+    """
+    This class writes the updates of the UpdateQueue to the database on the background with its own database connection.
+    """
+    signal = pyqtSignal('PyQt_PyObject')
 
-UNLOCK_DAILY_LIST = """
-    UPDATE
-        daily_list
-    SET
-        author_lock = NULL
-    WHERE
-        daily_list_date = %(daily_list_date)s
-    AND
-        author_lock = CURRENT_USER
-    RETURNING
-        author_lock
-"""
+    def __init__(self, update_queue, database_accesser):
+        QThread.__init__(self)
 
-GET_CURRENT_USER = """
-    SELECT
-        CURRENT_USER
+        self.update_queue = update_queue
+        self.database_accesser = database_accesser
 
-"""
+    def run(self):
+        """
+        Write all queued updates to the database. Transient connection errors are retried with an exponential backoff and if all retries fail the updates are returned to the queue.
+        """
+        update_events = self.update_queue.takeUpdateEvents()
+        results = []
 
-IS_EVENT_CLASSIFICATION_LOCKED = """
-    SELECT
-        (author_lock = CURRENT_USER)
-    FROM
-        daily_list, event_classification
-    WHERE
-        daily_list.id = event_classification.daily_id
-    AND
-        event_classification.id = %(event_classification_id)s
-"""
+        try:
+            for attempt in range(DATABASE_WRITE_RETRIES + 1):
+                if not update_events:
+                    break
 
-UPDATE_ANALYSIS_ID = """
-    UPDATE
-        event_classification
-    SET
-        analysis_id = %(analysis_id)s
-    WHERE
-        id = %(event_classification_id)s
-    AND
-        (
-        SELECT
-            author_lock = CURRENT_USER
-        FROM
-            daily_list, event_classification
-        WHERE
-            daily_list.id = event_classification.daily_id
-        AND
-            event_classification.id = %(event_classification_id)s
-        )
-    RETURNING True
-"""
+                try:
+                    results = self.update_queue.writeUpdateEvents(update_events, self.database_accesser)
+                    break
+                except (OperationalError, InterfaceError, PoolError) as e:
+                    self.database_accesser.releaseConnection(discard = True)
+
+                    if attempt == DATABASE_WRITE_RETRIES:
+                        print('Failed to write updates to the database, retrying later: {0}'.format(e))
+                        self.update_queue.requeueUpdateEvents(update_events)
+                        break
+
+                    time.sleep(DATABASE_WRITE_BACKOFF * 2 ** attempt)
+                except Exception as e:
+                    print('Failed to write updates to the database: {0}'.format(e))
+                    results = [update_event[:3] + [False] for update_event in update_events]
+                    break
+        finally:
+            self.database_accesser.releaseConnection()
 
-UPDATE_PRIORITY = """
-    UPDATE
-        event_classification
-    SET
-        priority = %(priority)s
-    WHERE
-        id = %(event_classification_id)s
-    AND
-        (
-        SELECT
-            author_lock = CURRENT_USER
-        FROM
-            daily_list, event_classification
-        WHERE
-            daily_list.id = event_classification.daily_id
-        AND
-            event_classification.id = %(event_classification_id)s
-        )
-    RETURNING
-        True
-"""
+        self.signal.emit(results)
 
-UPDATE_USERNAME = """
-    UPDATE
-        event_classification
-    SET
-        username = %(username)s
-    WHERE
-        id = %(event_classification_id)s
-    AND
-        (
-        SELECT
-            author_lock = CURRENT_USER
-        FROM
-            daily_list, event_classification
-        WHERE
-            daily_list.id = event_classification.daily_id
-        AND
-            event_classification.id = %(event_classification_id)s
-        )
-    RETURNING
-        True
-"""
+class NordicEventLoaderThread(QThread):
+    """
+    This class loads the full NordicEvents of a daily list on the background in pages of NORDIC_EVENT_PAGE_SIZE events.
+    """
+    signal = pyqtSignal('PyQt_PyObject')
 
-UPDATE_UNIMPORTANT = """
-    UPDATE
-        event_classification
-    SET
-        unimportant = %(unimportant)s
-    WHERE
-        id = %(event_classification_id)s
-    AND
-        (
-        SELECT
-            author_lock = CURRENT_USER
-        FROM
-            daily_list, event_classification
-        WHERE
-            daily_list.id = event_classification.daily_id
-        AND
-            event_classification.id = %(event_classification_id)s
-        )
-    RETURNING
-        True
-"""
+    def __init__(self, database_accesser):
+        QThread.__init__(self)
 
-UPDATE_DONE = """
-    UPDATE
-        event_classification
-    SET
-        done = True
-    WHERE
-        id = %(event_classification_id)s
-    AND
-        (
-        SELECT
-            author_lock = CURRENT_USER
-        FROM
-            daily_list, event_classification
-        WHERE
-            daily_list.id = event_classification.daily_id
-        AND
-            event_classification.id = %(event_classification_id)s
-        )
-    RETURNING
-        True
-"""
+        self.database_accesser = database_accesser
+        self.event_ids = []
+        self.generation = 0
+        self.interrupt = False
 
+    def run(self):
+        """
+        Fetch the events in pages and emit each page together with the generation it was requested for
+        """
+        event_ids = self.event_ids
+        generation = self.generation
 
+        try:
+            for i in range(0, len(event_ids), NORDIC_EVENT_PAGE_SIZE):
+                if self.interrupt:
+                    break
 
+                events = self.database_accesser.getNordicEvents(event_ids[i:i + NORDIC_EVENT_PAGE_SIZE])
+                self.signal.emit([generation, events])
+        except Exception as e:
+            print('Failed to load events from the database: {0}'.format(e))
+        finally:
+            self.database_accesser.releaseConnection()
+
+BATCH_UPDATE_OPERATIONS = {
+    UpdateQueue.ANALYSIS_ID_UPDATE_OPERATION: BATCH_UPDATE_ANALYSIS_ID,
+    UpdateQueue.PRIORITY_UPDATE_OPERATION: BATCH_UPDATE_PRIORITY,
+    UpdateQueue.USERNAME_UPDATE_OPERATION: BATCH_UPDATE_USERNAME,
+    UpdateQueue.UNIMPORTANT_UPDATE_OPERATION: BATCH_UPDATE_UNIMPORTANT,
+    UpdateQueue.DONE_UPDATE_OPERATION: BATCH_UPDATE_DONE,
+}
@@ -0,0 +1,273 @@
+"""
+This module contains the SQL statements NorLyst runs against the nordb database. The module has no Qt dependencies so the scripts of the sql folder can use the statements as well.
+"""
+
+GET_DAILY_LIST = """
+    SELECT
+        id, author_lock
+    FROM
+        daily_list
+    WHERE
+        daily_list_date = %(daily_list_date)s
+"""
+
+GET_EVENT_CLASSIFICATIONS = """
+    SELECT
+        id, daily_id, priority, event_id, classification, eqex, certainty, username, analysis_id, unimportant, done
+    FROM
+        event_classification
+    WHERE
+        daily_id = %(daily_list_id)s
+"""
+
+GET_EVENT_HEADERS = """
+    SELECT DISTINCT ON (nordic_event.id)
+        nordic_event.id, nordic_header_main.origin_date, nordic_header_main.origin_time,
+        nordic_header_main.epicenter_latitude, nordic_header_main.epicenter_longitude,
+        nordic_header_main.magnitude_1, nordic_header_waveform.waveform_info
+    FROM
+        nordic_event
+    LEFT JOIN
+        nordic_header_main ON nordic_header_main.event_id = nordic_event.id
+    LEFT JOIN
+        nordic_header_waveform ON nordic_header_waveform.event_id = nordic_event.id
+    WHERE
+        nordic_event.id = ANY(%(event_ids)s)
+    ORDER BY
+        nordic_event.id, nordic_header_main.id, nordic_header_waveform.id
+"""
+
+GET_EVENT_FINGERPRINT = """
+    SELECT
+        (SELECT COUNT(*) FROM nordic_header_main WHERE event_id = ANY(%(event_ids)s)),
+        (SELECT MAX(id) FROM nordic_header_main WHERE event_id = ANY(%(event_ids)s)),
+        (SELECT COUNT(*) FROM nordic_header_waveform WHERE event_id = ANY(%(event_ids)s)),
+        (SELECT MAX(id) FROM nordic_header_waveform WHERE event_id = ANY(%(event_ids)s)),
+        (SELECT COUNT(*) FROM nordic_phase_data WHERE event_id = ANY(%(event_ids)s)),
+        (SELECT MAX(id) FROM nordic_phase_data WHERE event_id = ANY(%(event_ids)s))
+"""
+
+IS_DATE_LOCKED_TO_USER = """
+    SELECT
+        1
+    FROM
+        daily_list
+    WHERE
+        author_lock = CURRENT_USER
+    AND
+        daily_list_date = %(daily_list_date)s
+"""
+
+IS_DATE_LOCKED = """
+    SELECT
+        author_lock
+    FROM
+        daily_list
+    WHERE
+        daily_list_date = %(daily_list_date)s
+"""
+
+LOCK_DAILY_LIST = """
+    UPDATE
+        daily_list
+    SET
+        author_lock = COALESCE(author_lock, CURRENT_USER)
+    WHERE
+        daily_list_date = %(daily_list_date)s
+    RETURNING
+        author_lock
+"""
+
+UNLOCK_DAILY_LIST = """
+    UPDATE
+        daily_list
+    SET
+        author_lock = NULL
+    WHERE
+        daily_list_date = %(daily_list_date)s
+    AND
+        author_lock = CURRENT_USER
+    RETURNING
+        author_lock
+"""
+
+HEALTH_CHECK = """
+    SELECT
+        1
+"""
+
+GET_CURRENT_USER = """
+    SELECT
+        CURRENT_USER
+
+"""
+
+UPDATE_ANALYSIS_ID = """
+    UPDATE
+        event_classification
+    SET
+        analysis_id = %(analysis_id)s
+    FROM
+        daily_list
+    WHERE
+        daily_list.id = event_classification.daily_id
+    AND
+        event_classification.id = %(event_classification_id)s
+    AND
+        daily_list.author_lock = CURRENT_USER
+    RETURNING
+        True
+"""
+
+UPDATE_PRIORITY = """
+    UPDATE
+        event_classification
+    SET
+        priority = %(priority)s
+    FROM
+        daily_list
+    WHERE
+        daily_list.id = event_classification.daily_id
+    AND
+        event_classification.id = %(event_classification_id)s
+    AND
+        daily_list.author_lock = CURRENT_USER
+    RETURNING
+        True
+"""
+
+UPDATE_USERNAME = """
+    UPDATE
+        event_classification
+    SET
+        username = %(username)s
+    FROM
+        daily_list
+    WHERE
+        daily_list.id = event_classification.daily_id
+    AND
+        event_classification.id = %(event_classification_id)s
+    AND
+        daily_list.author_lock = CURRENT_USER
+    RETURNING
+        True
+"""
+
+UPDATE_UNIMPORTANT = """
+    UPDATE
+        event_classification
+    SET
+        unimportant = %(unimportant)s
+    FROM
+        daily_list
+    WHERE
+        daily_list.id = event_classification.daily_id
+    AND
+        event_classification.id = %(event_classification_id)s
+    AND
+        daily_list.author_lock = CURRENT_USER
+    RETURNING
+        True
+"""
+
+UPDATE_DONE = """
+    UPDATE
+        event_classification
+    SET
+        done = True
+    FROM
+        daily_list
+    WHERE
+        daily_list.id = event_classification.daily_id
+    AND
+        event_classification.id = %(event_classification_id)s
+    AND
+        daily_list.author_lock = CURRENT_USER
+    RETURNING
+        True
+"""
+
+BATCH_UPDATE_ANALYSIS_ID = """
+    UPDATE
+        event_classification
+    SET
+        analysis_id = update_values.analysis_id
+    FROM
+        (VALUES %s) AS update_values (id, analysis_id), daily_list
+    WHERE
+        event_classification.id = update_values.id
+    AND
+        daily_list.id = event_classification.daily_id
+    AND
+        daily_list.author_lock = CURRENT_USER
+    RETURNING
+        event_classification.id
+"""
+
+BATCH_UPDATE_PRIORITY = """
+    UPDATE
+        event_classification
+    SET
+        priority = update_values.priority
+    FROM
+        (VALUES %s) AS update_values (id, priority), daily_list
+    WHERE
+        event_classification.id = update_values.id
+    AND
+        daily_list.id = event_classification.daily_id
+    AND
+        daily_list.author_lock = CURRENT_USER
+    RETURNING
+        event_classification.id
+"""
+
+BATCH_UPDATE_USERNAME = """
+    UPDATE
+        event_classification
+    SET
+        username = update_values.username
+    FROM
+        (VALUES %s) AS update_values (id, username), daily_list
+    WHERE
+        event_classification.id = update_values.id
+    AND
+        daily_list.id = event_classification.daily_id
+    AND
+        daily_list.author_lock = CURRENT_USER
+    RETURNING
+        event_classification.id
+"""
+
+BATCH_UPDATE_UNIMPORTANT = """
+    UPDATE
+        event_classification
+    SET
+        unimportant = update_values.unimportant
+    FROM
+        (VALUES %s) AS update_values (id, unimportant), daily_list
+    WHERE
+        event_classification.id = update_values.id
+    AND
+        daily_list.id = event_classification.daily_id
+    AND
+        daily_list.author_lock = CURRENT_USER
+    RETURNING
+        event_classification.id
+"""
+
+BATCH_UPDATE_DONE = """
+    UPDATE
+        event_classification
+    SET
+        done = update_values.done
+    FROM
+        (VALUES %s) AS update_values (id, done), daily_list
+    WHERE
+        event_classification.id = update_values.id
+    AND
+        daily_list.id = event_classification.daily_id
+    AND
+        daily_list.author_lock = CURRENT_USER
+    RETURNING
+        event_classification.id
+"""
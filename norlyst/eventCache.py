@@ -0,0 +1,201 @@
+"""
+This module contains the local on-disk cache of NordicEvents that have already been fetched from the database.
+"""
+import os
+import time
+import pickle
+import sqlite3
+import threading
+
+from norlyst.config import EVENT_CACHE_FILE_PATH, EVENT_CACHE_MAX_SIZE
+
+class NordicEventCache():
+    """
+    This class stores pickled NordicEvents in a SQLite file keyed by event id. The cached events of a daily list are validated against a fingerprint of the database rows of the list and the cache is kept under max_size bytes by evicting the least recently used events.
+    """
+    def __init__(self, cache_file_path = EVENT_CACHE_FILE_PATH, max_size = EVENT_CACHE_MAX_SIZE):
+        os.makedirs(os.path.dirname(cache_file_path), exist_ok = True)
+
+        self.max_size = max_size
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(cache_file_path, check_same_thread = False)
+
+        with self.__lock:
+            self.__conn.execute(CREATE_EVENT_TABLE)
+            self.__conn.execute(CREATE_FINGERPRINT_TABLE)
+            self.__conn.commit()
+
+    def __del__(self):
+        self.__conn.close()
+
+    def isDailyListValid(self, daily_list_date, fingerprint):
+        """
+        Function for checking if the cached events of a daily list are still valid. Returns True if the fingerprint matches the one stored with the cached events.
+        """
+        with self.__lock:
+            ans = self.__conn.execute(GET_FINGERPRINT, (str(daily_list_date),)).fetchone()
+
+        return ans is not None and ans[0] == fingerprint
+
+    def setDailyListFingerprint(self, daily_list_date, fingerprint):
+        """
+        Function for storing the fingerprint of a daily list after its cached events have been invalidated
+        """
+        with self.__lock:
+            self.__conn.execute(SET_FINGERPRINT, (str(daily_list_date), fingerprint))
+            self.__conn.commit()
+
+    def getEvents(self, event_ids):
+        """
+        Function for getting events from the cache. Returns a dictionary of event_id and NordicEvent pairs for the events that were found. Events that cannot be unpickled are removed from the cache so they are fetched from the database again.
+        """
+        events = {}
+
+        if not event_ids:
+            return events
+
+        with self.__lock:
+            broken_ids = []
+            for event_id in event_ids:
+                ans = self.__conn.execute(GET_EVENT, (event_id,)).fetchone()
+
+                if ans is None:
+                    continue
+
+                try:
+                    events[event_id] = pickle.loads(ans[0])
+                except Exception as e:
+                    print('Reading cached event {0} failed: {1}'.format(event_id, e))
+                    broken_ids.append((event_id,))
+
+            self.__conn.executemany(REMOVE_EVENT, broken_ids)
+            self.__conn.executemany(TOUCH_EVENT, [(time.time(), event_id) for event_id in events])
+            self.__conn.commit()
+
+        return events
+
+    def putEvents(self, events):
+        """
+        Function for storing events to the cache. Evicts the least recently used events if the cache grows over its size limit.
+        """
+        if not events:
+            return
+
+        rows = []
+        for event in events:
+            event_data = pickle.dumps(event, pickle.HIGHEST_PROTOCOL)
+            rows.append((event.event_id, event_data, len(event_data), time.time()))
+
+        with self.__lock:
+            self.__conn.executemany(PUT_EVENT, rows)
+            self.__evict()
+            self.__conn.commit()
+
+    def removeEvents(self, event_ids):
+        """
+        Function for removing events from the cache
+        """
+        with self.__lock:
+            self.__conn.executemany(REMOVE_EVENT, [(event_id,) for event_id in event_ids])
+            self.__conn.commit()
+
+    def __evict(self):
+        """
+        Remove the least recently used events until the cache fits in its size limit
+        """
+        cache_size = self.__conn.execute(GET_CACHE_SIZE).fetchone()[0]
+
+        if cache_size is None or cache_size <= self.max_size:
+            return
+
+        evicted_ids = []
+        for event_id, event_size in self.__conn.execute(GET_EVENTS_BY_LAST_ACCESS).fetchall():
+            if cache_size <= self.max_size:
+                break
+
+            evicted_ids.append((event_id,))
+            cache_size -= event_size
+
+        self.__conn.executemany(REMOVE_EVENT, evicted_ids)
+
+CREATE_EVENT_TABLE = """
+    CREATE TABLE IF NOT EXISTS nordic_event_cache(
+        event_id INTEGER PRIMARY KEY,
+        event_data BLOB,
+        event_size INTEGER,
+        last_access REAL
+    )
+"""
+
+CREATE_FINGERPRINT_TABLE = """
+    CREATE TABLE IF NOT EXISTS daily_list_fingerprint(
+        daily_list_date TEXT PRIMARY KEY,
+        fingerprint TEXT
+    )
+"""
+
+GET_FINGERPRINT = """
+    SELECT
+        fingerprint
+    FROM
+        daily_list_fingerprint
+    WHERE
+        daily_list_date = ?
+"""
+
+SET_FINGERPRINT = """
+    INSERT OR REPLACE INTO
+        daily_list_fingerprint
+        (daily_list_date, fingerprint)
+    VALUES
+        (?, ?)
+"""
+
+GET_EVENT = """
+    SELECT
+        event_data
+    FROM
+        nordic_event_cache
+    WHERE
+        event_id = ?
+"""
+
+TOUCH_EVENT = """
+    UPDATE
+        nordic_event_cache
+    SET
+        last_access = ?
+    WHERE
+        event_id = ?
+"""
+
+PUT_EVENT = """
+    INSERT OR REPLACE INTO
+        nordic_event_cache
+        (event_id, event_data, event_size, last_access)
+    VALUES
+        (?, ?, ?, ?)
+"""
+
+REMOVE_EVENT = """
+    DELETE FROM
+        nordic_event_cache
+    WHERE
+        event_id = ?
+"""
+
+GET_CACHE_SIZE = """
+    SELECT
+        SUM(event_size)
+    FROM
+        nordic_event_cache
+"""
+
+GET_EVENTS_BY_LAST_ACCESS = """
+    SELECT
+        event_id, event_size
+    FROM
+        nordic_event_cache
+    ORDER BY
+        last_access
+"""
@@ -11,7 +11,7 @@ from PyQt5.QtGui import QIcon, QPixmap, QColor, QPainter, QFont
 from PyQt5.QtCore import Qt, QUrl, QPointF
 from PyQt5.QtQuickWidgets import QQuickWidget
 
-from pyqtgraph import PlotWidget, PlotDataItem, PlotItem, TextItem, ErrorBarItem, mkPen, setConfigOption
+from pyqtgraph import PlotWidget, PlotDataItem, PlotItem, PlotCurveItem, TextItem, mkPen, setConfigOption
 
 from obspy import UTCDateTime
 
@@ -23,9 +23,9 @@ from nordb.nordic.nordicComment import NordicComment
 from nordb import createNordicEvents
 from nordb import getAllStations
 
-from norlyst.config import CLASSIFICATION_COLOR_DICT, CLASSIFICATION_STRING_DICT, CLASSIFICATION_PRIORITY_DICT, MAX_PLOT_SIZE, DEFAULT_FILTERS, PROJECT_FILE_PATH
-from norlyst.eventWindows import SpectrogramWindow, ImportWindow
-from norlyst.misc import FilterStats, FilterWidget, filterTrace
+from norlyst.config import CLASSIFICATION_COLOR_DICT, CLASSIFICATION_STRING_DICT, CLASSIFICATION_PRIORITY_DICT, MAX_PLOT_SIZE, TEXT_ITEM_DEFAULT_COLOR, DEFAULT_FILTERS, PROJECT_FILE_PATH
+from norlyst.eventWindows import SpectrogramWindow, SpectrogramGridWindow, SpectrogramBatchManager, ImportWindow
+from norlyst.misc import FilterStats, FilterWidget, FilteredTraceCache, SpectrogramCache
 from norlyst.overviewPage import MarkerModel, MapMarker
 
 class EventPage(QWidget):
@@ -59,6 +59,12 @@ class EventPage(QWidget):
         self.setLayout(self.layout)
 
         self.spectrogram_widget = None
+        self.spectrogram_grid_widget = None
+        self.spectrogram_cache = SpectrogramCache()
+        self.spectrogram_filter_stats = FilterStats(True)
+        self.spectrogram_batch = SpectrogramBatchManager(
+            self, self.station_list, self.spectrogram_cache, self.spectrogram_filter_stats
+        )
         self.nordic_widget = None
         self.comment_widget = None
 
@@ -72,10 +78,21 @@ class EventPage(QWidget):
         """
         Function for opening the spectrogram window
         """
-        self.spectrogram_widget = SpectrogramWindow(self.station_list)
+        self.spectrogram_widget = SpectrogramWindow(
+            self.station_list, self.spectrogram_cache, self.spectrogram_filter_stats, self.spectrogram_batch
+        )
 
         self.spectrogram_widget.show()
 
+    def openSpectrogramGridWindow(self):
+        """
+        Function for opening the window with the spectrograms of all selected stations
+        """
+        self.spectrogram_grid_widget = SpectrogramGridWindow(self.spectrogram_cache, self.spectrogram_batch)
+        self.spectrogram_batch.precompute()
+
+        self.spectrogram_grid_widget.show()
+
     def openCommentWindow(self):
         """
         Function for opening the comment window
@@ -140,6 +157,8 @@ class ButtonList(QWidget):
 
         self.spectrograms_window_btn = QPushButton('Spectrograms', self)
         self.spectrograms_window_btn.pressed.connect(self.parent().openSpectrogramWindow)
+        self.spectrogram_grid_window_btn = QPushButton('Spectrogram Grid', self)
+        self.spectrogram_grid_window_btn.pressed.connect(self.parent().openSpectrogramGridWindow)
         self.comments_window_btn = QPushButton('Comments', self)
         self.comments_window_btn.pressed.connect(self.parent().openCommentWindow)
         self.nordic_window_btn = QPushButton('Nordic', self)
@@ -149,6 +168,7 @@ class ButtonList(QWidget):
 
         self.layout.addWidget(self.nordic_window_btn)
         self.layout.addWidget(self.spectrograms_window_btn)
+        self.layout.addWidget(self.spectrogram_grid_window_btn)
         self.layout.addWidget(self.comments_window_btn)
         self.layout.addWidget(self.export_window_btn)
 
@@ -166,7 +186,7 @@ class StationList(QWidget):
         self.station_list_label = QLabel('Station List', self)
         self.station_list = QListWidget(self)
         self.station_list.setSelectionMode(QAbstractItemView.MultiSelection)
-        self.station_list.itemClicked.connect(self.plotWaveforms)
+        self.station_list.itemClicked.connect(self.stationClicked)
 
         self.only_z_checkbox = QCheckBox('Show only z-channels', self)
         self.only_z_checkbox.stateChanged.connect(self.plotWaveforms)
@@ -178,51 +198,82 @@ class StationList(QWidget):
 
         self.waveform_traces = None
         self.event = None
+        self.station_data = []
+        self.stat_dict = {}
+        self.user_selection = False
 
     def setCurrentWaveforms(self, waveform_traces, event):
         """
         Function for setting this list of stations
         """
         self.event = event
-        self.waveform_traces = waveform_traces
+        self.waveform_traces = {}
+        self.station_data = []
+        self.user_selection = False
 
         stations = getAllStations(station_date = event.getOriginTime().val)
-        stat_dict = {}
+        self.stat_dict = {}
 
         for stat in stations:
-            stat_dict[stat.station_code] = stat
+            self.stat_dict[stat.station_code] = stat
+
+        self.station_list.clear()
+
+        self.updateCurrentWaveforms(waveform_traces)
 
-        station_data = []
+    def updateCurrentWaveforms(self, station_waveforms):
+        """
+        Function for adding the stations that have been read after the list was set. The new stations are placed by their distance and the current selection of the user is kept.
+        """
+        if self.event is None:
+            return
 
+        new_station_data = []
         geodesic = pyproj.Geod(ellps='WGS84')
-        for tr in waveform_traces.values():
-            if tr[0].stats['station'] in stat_dict.keys():
+
+        for station_name, tr in station_waveforms.items():
+            if station_name in self.waveform_traces:
+                continue
+
+            self.waveform_traces[station_name] = tr
+
+            if tr[0].stats['station'] in self.stat_dict.keys():
                 fwd_azimuth, back_azimuth, distance = geodesic.inv(
-                    event.getLatitude().val, event.getLongitude().val,
-                    stat_dict[tr[0].stats['station']].latitude, stat_dict[tr[0].stats['station']].longitude
+                    self.event.getLatitude().val, self.event.getLongitude().val,
+                    self.stat_dict[tr[0].stats['station']].latitude, self.stat_dict[tr[0].stats['station']].longitude
                 )
-                station_data.append([tr[0].stats['station'], int(distance/1000), int(fwd_azimuth)])
+                new_station_data.append([tr[0].stats['station'], int(distance/1000), int(fwd_azimuth)])
             else:
-                station_data.append([tr[0].stats['station'], None, None])
+                new_station_data.append([tr[0].stats['station'], None, None])
 
-        station_data = sorted(station_data, key = lambda x: (x[1] is None, x[1]))
+        if not new_station_data:
+            return
 
-        self.station_list.clear()
-        counter = 0
+        for st in new_station_data:
+            self.station_data.append(st)
+            self.station_data = sorted(self.station_data, key = lambda x: (x[1] is None, x[1] or 0))
+            row = self.station_data.index(st)
 
-        for st in station_data:
             if st[1] is not None:
-                new_item = QListWidgetItem("{0} - {1} km - {2}°".format(*st), self.station_list)
+                new_item = QListWidgetItem("{0} - {1} km - {2}°".format(*st))
             else:
-                new_item = QListWidgetItem("{0}".format(st[0]), self.station_list)
+                new_item = QListWidgetItem("{0}".format(st[0]))
+
+            self.station_list.insertItem(row, new_item)
 
-            if counter < 5:
-                new_item.setSelected(True)
-                counter += 1
+        if not self.user_selection:
+            for row in range(self.station_list.count()):
+                self.station_list.item(row).setSelected(row < 5)
 
-            self.station_list.addItem(new_item)
+        self.plotWaveforms()
 
+    def stationClicked(self):
+        """
+        Function for keeping the selection of the user when more stations are added to the list
+        """
+        self.user_selection = True
         self.plotWaveforms()
+        self.parent().spectrogram_batch.precompute()
 
     def getCurrentTraceAndPPickForStation(self, station_name):
         """
@@ -298,9 +349,73 @@ class StationList(QWidget):
 
         self.parent().waveform_plot_widget.setNewTraces(plot_waves, self.event)
 
+class MinMaxPyramid():
+    """
+    Min/max envelope pyramid of a trace normalised to values between 0 and 1. Level 0 is the trace itself and every next level halves the resolution by keeping the minimum and maximum of each pair of buckets of the previous level.
+    """
+    def __init__(self, trace):
+        data_array = trace.data
+        min_value = numpy.amin(data_array)
+        max_value = numpy.amax(data_array) - min_value
+
+        if max_value == 0:
+            max_value = 1.0
+
+        self.delta = trace.stats['delta']
+        self.npts = len(data_array)
+        self.mins = [(data_array - min_value) / max_value]
+        self.maxs = [self.mins[0]]
+
+        while len(self.mins[-1]) > 2:
+            mins = self.mins[-1]
+            maxs = self.maxs[-1]
+            pair_count = len(mins) // 2 * 2
+
+            new_mins = numpy.minimum(mins[0:pair_count:2], mins[1:pair_count:2])
+            new_maxs = numpy.maximum(maxs[0:pair_count:2], maxs[1:pair_count:2])
+
+            if pair_count < len(mins):
+                new_mins = numpy.append(new_mins, mins[-1])
+                new_maxs = numpy.append(new_maxs, maxs[-1])
+
+            self.mins.append(new_mins)
+            self.maxs.append(new_maxs)
+
+    def getLine(self, start_time, end_time, max_points):
+        """
+        Function for getting the times and values to draw between start_time and end_time, relative to the start of the trace, with at most about max_points points. The first and last sample of the trace are always included so that the bounds of the line stay the bounds of the whole trace. Returns the times, the values and the level and bucket range the line was made of.
+        """
+        first_index = min(max(int(start_time / self.delta), 0), self.npts - 1)
+        last_index = min(max(int(numpy.ceil(end_time / self.delta)) + 1, first_index + 1), self.npts)
+
+        level = 0
+        while (last_index - first_index) >> level > max_points // 2 and level < len(self.mins) - 1:
+            level += 1
+
+        first_bucket = first_index >> level
+        last_bucket = ((last_index - 1) >> level) + 1
+
+        if level == 0:
+            times = numpy.arange(first_bucket, last_bucket) * self.delta
+            values = self.mins[0][first_bucket:last_bucket]
+        else:
+            times = numpy.repeat((numpy.arange(first_bucket, last_bucket) << level) * self.delta, 2)
+            values = numpy.empty(2 * (last_bucket - first_bucket))
+            values[0::2] = self.mins[level][first_bucket:last_bucket]
+            values[1::2] = self.maxs[level][first_bucket:last_bucket]
+
+        if first_bucket > 0:
+            times = numpy.concatenate(([0.0], times))
+            values = numpy.concatenate(([self.mins[0][0]], values))
+        if last_bucket < len(self.mins[level]):
+            times = numpy.concatenate((times, [(self.npts - 1) * self.delta]))
+            values = numpy.concatenate((values, [self.mins[0][-1]]))
+
+        return times, values, (level, first_bucket, last_bucket)
+
 class WaveformPlotWidget(QWidget):
     """
-    This widget contains the functionality for a single waveform plot
+    This widget contains the functionality for a single waveform plot. All traces are drawn by a single curve item and the picks by one curve item per pick colour, and the items are updated in place on every redraw.
     """
     def __init__(self, parent, filter_stats):
         super(QWidget, self).__init__(parent)
@@ -309,6 +424,7 @@ class WaveformPlotWidget(QWidget):
         setConfigOption('background', 1.0)
 
         self.filter_stats = filter_stats
+        self.filtered_trace_cache = FilteredTraceCache()
 
         self.plot_widget = PlotWidget(self)
         self.plot_widget.getPlotItem().setLabel('bottom', 'time')
@@ -318,17 +434,48 @@ class WaveformPlotWidget(QWidget):
         self.msg_pick_pen = mkPen(color = (2, 67, 171), width = 1.0)
         self.plot_pen = mkPen(color = (0, 0, 0), width = 1.0)
 
+        self.trace_curve = PlotCurveItem(pen = self.plot_pen)
+        self.plot_widget.getPlotItem().addItem(self.trace_curve)
+
+        self.pick_curves = {}
+        for phase, pick_pen in [['P', self.p_pick_pen], ['S', self.s_pick_pen], ['M', self.msg_pick_pen]]:
+            self.pick_curves[phase] = PlotCurveItem(pen = pick_pen)
+            self.plot_widget.getPlotItem().addItem(self.pick_curves[phase])
+
+        self.text_items = []
+        self.used_text_items = 0
+
+        self.plot_lines = []
+        self.pyramids = {}
+        self.plot_widget.getPlotItem().getViewBox().sigXRangeChanged.connect(self.updateDecimation)
+
         self.layout.addWidget(self.plot_widget, 0, 1, 3, 3)
 
+    def setTextItem(self, text, position, color = TEXT_ITEM_DEFAULT_COLOR):
+        """
+        Function for showing a text on the plot. Text items are reused from earlier redraws and only created when there are not enough of them.
+        """
+        if self.used_text_items == len(self.text_items):
+            text_item = TextItem()
+            self.plot_widget.getPlotItem().addItem(text_item)
+            self.text_items.append(text_item)
+
+        text_item = self.text_items[self.used_text_items]
+        self.used_text_items += 1
+
+        text_item.setText(text, color = color)
+        text_item.setPos(*position)
+        text_item.setVisible(True)
+
     def setNewTraces(self, waveform_traces, plot_event):
         """
         Function for scaling and plotting waveform traces
         """
-        self.plot_widget.getPlotItem().clear()
-
         offset = 0
         first_event_timestamp = None
         pick_dict = {}
+        pick_lines = {'P': [[], []], 'S': [[], []], 'M': [[], []]}
+        self.used_text_items = 0
 
         for pick in plot_event.data:
             if pick.station_code not in pick_dict:
@@ -343,25 +490,28 @@ class WaveformPlotWidget(QWidget):
                 elif first_event_timestamp > tr.stats['starttime']:
                     first_event_timestamp = tr.stats['starttime']
 
+        all_traces = [tr for key in waveform_traces.keys() for tr in waveform_traces[key]]
+        filtered_traces = dict(zip(
+            [id(tr) for tr in all_traces],
+            self.filtered_trace_cache.getFilteredTraces(self.filter_stats.getCurrentFilter(), all_traces)
+        ))
+
+        pyramids = {}
+        self.plot_lines = []
+
         for key in waveform_traces.keys():
             for tr in waveform_traces[key]:
-                tr_filter =  self.filter_stats.getCurrentFilter()
-                tr_copy = filterTrace(tr_filter, tr)
-
-                data_array = tr_copy.data
-                time_array = tr_copy.times()
-                time_offset = tr_copy.stats['starttime'] - first_event_timestamp
+                tr_copy = filtered_traces[id(tr)]
 
-                min_value = numpy.amin(data_array)
-                max_value = numpy.amax(data_array) - min_value
-                data_array = ((data_array - min_value) / max_value) - offset
+                if id(tr_copy) in self.pyramids and self.pyramids[id(tr_copy)][0] is tr_copy:
+                    pyramids[id(tr_copy)] = self.pyramids[id(tr_copy)]
+                else:
+                    pyramids[id(tr_copy)] = [tr_copy, MinMaxPyramid(tr_copy)]
 
-                time_array += time_offset
+                time_offset = tr_copy.stats['starttime'] - first_event_timestamp
 
-                self.plot_widget.getPlotItem().plot(time_array, data_array, pen = self.plot_pen)
-                channel_text_item = TextItem("{0} - {1}".format(key, tr.stats['channel']))
-                self.plot_widget.getPlotItem().addItem(channel_text_item)
-                channel_text_item.setPos(-20, 0.5 - offset)
+                self.plot_lines.append([pyramids[id(tr_copy)][1], time_offset, offset, None, None, None])
+                self.setTextItem("{0} - {1}".format(key, tr.stats['channel']), (-20, 0.5 - offset))
                 offset += 1
 
             if key in pick_dict:
@@ -372,24 +522,71 @@ class WaveformPlotWidget(QWidget):
                     tr_size = len(waveform_traces[key])
                     time_pos = UTCDateTime(pick.observation_time) - first_event_timestamp
 
-                    if pick.phase_type[0] == 'S':
-                        pick_pen = self.s_pick_pen
-                    elif pick.phase_type[0] == 'P':
-                        pick_pen = self.p_pick_pen
-                    else:
-                        pick_pen = self.msg_pick_pen
-
-                    pick_bar = ErrorBarItem(
-                        x = numpy.array([time_pos]),
-                        y = numpy.array([float(tr_size) / 2 - offset + 1]),
-                        height = tr_size,
-                        pen = pick_pen
+                    pick_lines[pick.phase_type[0]][0].extend([time_pos, time_pos])
+                    pick_lines[pick.phase_type[0]][1].extend([1 - offset, 1 + tr_size - offset])
+
+                    self.setTextItem(
+                        pick.phase_type,
+                        (time_pos, 1.1 + tr_size - offset),
+                        self.pick_curves[pick.phase_type[0]].opts['pen'].color()
                     )
 
-                    pick_text = TextItem(pick.phase_type, color = pick_pen.color())
-                    self.plot_widget.getPlotItem().addItem(pick_bar)
-                    self.plot_widget.getPlotItem().addItem(pick_text)
-                    pick_text.setPos(time_pos, 1.1 + tr_size - offset)
+        for phase, pick_line in pick_lines.items():
+            self.pick_curves[phase].setData(numpy.array(pick_line[0]), numpy.array(pick_line[1]), connect = 'pairs')
+
+        for text_item in self.text_items[self.used_text_items:]:
+            text_item.setVisible(False)
+
+        self.pyramids = pyramids
+        self.updateDecimation(full_range = True)
+
+    def updateDecimation(self, *args, full_range = False):
+        """
+        Function for drawing the traces with the level of the min/max pyramids that gives about 2 * MAX_PLOT_SIZE points per pixel. Only the visible time range and one view width on both sides of it are drawn. Called every time the visible range changes, so zooming in shows all samples.
+        """
+        view_box = self.plot_widget.getPlotItem().getViewBox()
+        pixel_width = max(int(view_box.width()), 100)
+
+        if full_range:
+            max_points = 2 * MAX_PLOT_SIZE * pixel_width
+        else:
+            x_min, x_max = view_box.viewRange()[0]
+            view_width = x_max - x_min
+            max_points = 3 * 2 * MAX_PLOT_SIZE * pixel_width
+
+        changed = full_range
+
+        for plot_line in self.plot_lines:
+            pyramid, time_offset, offset, line_state = plot_line[:4]
+
+            if full_range:
+                start_time, end_time = 0.0, pyramid.npts * pyramid.delta
+            else:
+                start_time = x_min - view_width - time_offset
+                end_time = x_max + view_width - time_offset
+
+            times, values, new_line_state = pyramid.getLine(start_time, end_time, max_points)
+
+            if new_line_state == line_state:
+                continue
+
+            plot_line[3:] = [new_line_state, times + time_offset, values - offset]
+            changed = True
+
+        if not changed:
+            return
+
+        if not self.plot_lines:
+            self.trace_curve.setData(numpy.array([]), numpy.array([]))
+            return
+
+        x_array = numpy.concatenate([plot_line[4] for plot_line in self.plot_lines])
+        y_array = numpy.concatenate([plot_line[5] for plot_line in self.plot_lines])
+
+        connect_array = numpy.ones(len(x_array), dtype = bool)
+        connect_array[numpy.cumsum([len(plot_line[4]) for plot_line in self.plot_lines]) - 1] = False
+
+        self.trace_curve.setData(x_array, y_array, connect = connect_array)
 
 class EventList(QListWidget):
     """
@@ -445,7 +642,7 @@ class EventList(QListWidget):
         self.clear()
         for ec in event_classifications:
             try:
-                list_item = QListWidgetItem(ec.event.waveform_h[0].getWaveformFileName(), self)
+                list_item = QListWidgetItem(ec.event_header.getWaveformFileName(), self)
             except Exception as e:
                 list_item = QListWidgetItem(str(e), self)
 
@@ -654,20 +851,21 @@ class EventPageMap(QQuickWidget):
         """
         Focus map on a single event classification
         """
-        self.model.clearAll()
         if ec is None:
+            self.model.setMarkers([])
             return
 
         ec_color = QColor(*CLASSIFICATION_COLOR_DICT[ec.classification])
+        event_header = ec.getEventHeader()
 
-        self.model.addMarker(MapMarker(
+        self.model.setMarkers([MapMarker(
             ec.event_id,
-            QPointF(ec.getEvent().getLatitude().val, ec.getEvent().getLongitude().val),
+            QPointF(event_header.latitude, event_header.longitude),
             ec_color,
             ec.focus
-        ))
+        )])
 
-        self.rootObject().childItems()[0].updateMap(ec.getEvent().getLatitude().val, ec.getEvent().getLongitude().val)
+        self.rootObject().childItems()[0].updateMap(event_header.latitude, event_header.longitude)
 
     def updateEventPageMap(self):
         """
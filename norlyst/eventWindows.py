@@ -2,16 +2,15 @@
 This module contains all new windows that are openable from eventPage
 """
 import time
+import threading
+import multiprocessing
 from copy import deepcopy
-
-from scipy import signal
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import numpy
 
-from matplotlib import cm as colormap
-
-from PyQt5.QtWidgets import QWidget, QGridLayout, QComboBox, QLabel, QPushButton, QLineEdit, QFileDialog
-from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtWidgets import QWidget, QGridLayout, QComboBox, QLabel, QPushButton, QLineEdit, QFileDialog, QScrollArea
+from PyQt5.QtCore import QThread, QObject, pyqtSignal
 
 from pyqtgraph import PlotWidget, ImageItem
 
@@ -20,7 +19,8 @@ from obspy import UTCDateTime
 from nordb import createNordicEvents
 from nordb.nordic.nordicComment import NordicComment
 
-from norlyst.misc import FilterWidget, FilterStats, filterTrace
+from norlyst.misc import FilterWidget, filterTrace, createSpectrogramKey
+from norlyst.spectrogram import computeSpectrogram, computeWindowSpectrogram
 from norlyst.config import *
 
 """
@@ -144,7 +144,7 @@ class ImportWindow(QWidget):
 
             self.event.insert2DB(solution_type = 'REV', e_id = self.event_classification.event.event_id)
             self.event_classification.analysis_id = self.event.event_id
-            self.event_classification.analysis = self.event
+            self.event_classification.setAnalysis(self.event)
             self.event_classification.done = True
 
         elif self.analysis_type.currentText() == "Not an event":
@@ -232,7 +232,7 @@ class ImportWindow(QWidget):
 
         current_event.insert2DB(solution_type = 'REV', e_id = current_event.event_id)
         self.event_classification.analysis_id = current_event.event_id
-        self.event_classification.analysis = current_event
+        self.event_classification.setAnalysis(current_event)
         self.event_classification.done = True
 
 
@@ -265,10 +265,13 @@ class SpectrogramWindow(QWidget):
     """
     This is the class for the spectrogram window
     """
-    def __init__(self, station_list):
+    def __init__(self, station_list, spectrogram_cache, filter_stats, spectrogram_batch):
         super(QWidget, self).__init__()
         self.layout = QGridLayout(self)
         self.station_list = station_list
+        self.spectrogram_cache = spectrogram_cache
+        self.spectrogram_batch = spectrogram_batch
+        self.spectrogram_batch.spectrogram_ready.connect(self.spectrogramPrecomputed)
         self.hidden = False
 
         self.spectrogram_1 = PlotWidget(self)
@@ -280,15 +283,11 @@ class SpectrogramWindow(QWidget):
         self.station_box_1 = QComboBox(self)
         self.station_box_2 = QComboBox(self)
 
-        self.waiting_traces = [None, None]
-        self.waiting_p_picks = [None, None]
-        self.filter_stats = FilterStats(True)
+        self.requested_keys = [None, None]
+        self.filter_stats = filter_stats
 
-        self.spectrogram_threads = [None, None]
-        self.spectrogram_threads[0] = SpectrogramCalculatorThread(self.filter_stats, 0)
-        self.spectrogram_threads[0].signal.connect(self.plotSpectrogram)
-        self.spectrogram_threads[1] = SpectrogramCalculatorThread(self.filter_stats, 1)
-        self.spectrogram_threads[1].signal.connect(self.plotSpectrogram)
+        self.spectrogram_scheduler = SpectrogramJobScheduler(self, 2)
+        self.spectrogram_scheduler.signal.connect(self.plotSpectrogram)
 
         self.filter_widget = FilterWidget(self, self.filter_stats)
 
@@ -335,7 +334,24 @@ class SpectrogramWindow(QWidget):
         if trace is None:
             return
 
-        self.calculateSpectrogram(trace, p_pick, spectrogram_id)
+        spectrogram_key = None
+        if p_pick is not None:
+            spectrogram_key = createSpectrogramKey(
+                self.station_list.event.event_id, trace, p_pick, self.filter_stats.getCurrentFilter()
+            )
+
+        self.requested_keys[spectrogram_id] = spectrogram_key
+
+        if spectrogram_key is not None:
+            spectrogram = self.spectrogram_cache.get(spectrogram_key)
+            if spectrogram is not None:
+                self.spectrogram_scheduler.cancel(spectrogram_id)
+                self.showSpectrogram(spectrogram_id, spectrogram[0])
+                return
+
+        self.spectrogram_scheduler.submit(
+            spectrogram_id, trace, p_pick, spectrogram_key, self.filter_stats.getCurrentFilter()
+        )
 
     def setStationsFromNewEvent(self):
         """
@@ -363,41 +379,40 @@ class SpectrogramWindow(QWidget):
         """
         Function that is called when the filters have been changed
         """
+        self.spectrogram_batch.precompute()
         self.getTraceForSpectrogramThread(0)
         self.getTraceForSpectrogramThread(1)
 
-    def calculateSpectrogram(self, waveform_trace, p_pick, spectrogram_id):
+    def spectrogramPrecomputed(self, precomputed_spectrogram):
         """
-        Function for calculating a spectrogram
+        Function for showing a spectrogram from the batch computation if one of the plots is waiting for it
         """
-        if self.spectrogram_threads[spectrogram_id].running:
-            self.waiting_traces[spectrogram_id] = waveform_trace
-            self.waiting_p_picks[spectrogram_id] = p_pick
-            self.spectrogram_threads[spectrogram_id].interrupt = True
-        else:
-            self.spectrogram_threads[spectrogram_id].waveform_trace = waveform_trace
-            self.spectrogram_threads[spectrogram_id].p_pick = p_pick
-            self.spectrogram_threads[spectrogram_id].running = True
-            self.spectrogram_threads[spectrogram_id].start()
+        spectrogram_key, spectrogram = precomputed_spectrogram
+
+        for spectrogram_id in range(2):
+            if self.requested_keys[spectrogram_id] == spectrogram_key:
+                self.showSpectrogram(spectrogram_id, spectrogram[0])
 
     def plotSpectrogram(self, return_values):
         """
         Function for plotting a spectrogram
         """
-        spectrogram_id, spectrogram, sample_frequencies, sample_times = return_values
-        print("Window {0} done".format(spectrogram_id))
-
-        self.spectrogram_threads[spectrogram_id].running = False
-        self.spectrogram_threads[spectrogram_id].interrupt = False
-
-        if self.waiting_traces[spectrogram_id] is not None:
-            self.calculateSpectrogram(self.waiting_traces[spectrogram_id], self.waiting_p_picks[spectrogram_id], spectrogram_id)
-            self.waiting_traces[spectrogram_id] = None
-            self.waiting_p_picks[spectrogram_id] = None
+        spectrogram_id, generation, spectrogram_key, spectrogram = return_values
 
         if spectrogram is None:
             return
 
+        self.spectrogram_cache.putSpectrogram(spectrogram_key, spectrogram)
+
+        if generation == self.spectrogram_scheduler.getGeneration(spectrogram_id):
+            self.showSpectrogram(spectrogram_id, spectrogram[0])
+
+    def showSpectrogram(self, spectrogram_id, spectrogram):
+        """
+        Function for showing a colored spectrogram image on one of the spectrogram plots
+        """
+        spectrogram = ImageItem(spectrogram)
+
         if spectrogram_id == 0:
             self.spectrogram_1.clear()
             self.spectrogram_1.addItem(spectrogram)
@@ -405,65 +420,344 @@ class SpectrogramWindow(QWidget):
             self.spectrogram_2.clear()
             self.spectrogram_2.addItem(spectrogram)
 
-class SpectrogramCalculatorThread(QThread):
+class SpectrogramGridWindow(QWidget):
+    """
+    This is the class for the window that shows the spectrograms of all selected stations of the focused event at once
+    """
+    def __init__(self, spectrogram_cache, spectrogram_batch):
+        super(QWidget, self).__init__()
+        self.layout = QGridLayout(self)
+        self.spectrogram_cache = spectrogram_cache
+        self.spectrogram_batch = spectrogram_batch
+        self.hidden = False
+
+        self.scroll_area = QScrollArea(self)
+        self.scroll_area.setWidgetResizable(True)
+        self.grid_widget = QWidget(self.scroll_area)
+        self.grid_layout = QGridLayout(self.grid_widget)
+        self.scroll_area.setWidget(self.grid_widget)
+
+        self.layout.addWidget(self.scroll_area, 0, 0)
+        self.resize(SPECTRO_GRID_COLUMNS * SPECTRO_GRID_PLOT_WIDTH + 50, 2 * SPECTRO_GRID_PLOT_HEIGHT + 50)
+
+        self.spectrogram_plots = {}
+
+        self.spectrogram_batch.spectrograms_requested.connect(self.setStationsFromBatch)
+        self.spectrogram_batch.spectrogram_ready.connect(self.spectrogramPrecomputed)
+        self.setStationsFromBatch()
+
+    def closeEvent(self, event):
+        """
+        This function will be called when the SpectrogramGridWindow Closes
+        """
+        self.hidden = True
+
+    def setStationsFromBatch(self):
+        """
+        Create a plot for every station of the current batch of the spectrogram batch manager and show the spectrograms that have already been computed
+        """
+        for plot_widget in self.spectrogram_plots.values():
+            self.grid_layout.removeWidget(plot_widget)
+            plot_widget.deleteLater()
+
+        self.spectrogram_plots = {}
+
+        for i, (station_name, spectrogram_key) in enumerate(self.spectrogram_batch.current_keys):
+            plot_widget = PlotWidget(self.grid_widget)
+            plot_widget.setTitle(station_name)
+            plot_widget.setFixedWidth(SPECTRO_GRID_PLOT_WIDTH)
+            plot_widget.setFixedHeight(SPECTRO_GRID_PLOT_HEIGHT)
+
+            self.grid_layout.addWidget(plot_widget, i // SPECTRO_GRID_COLUMNS, i % SPECTRO_GRID_COLUMNS)
+            self.spectrogram_plots[spectrogram_key] = plot_widget
+
+            spectrogram = self.spectrogram_cache.get(spectrogram_key)
+            if spectrogram is not None:
+                plot_widget.addItem(ImageItem(spectrogram[0]))
+
+    def spectrogramPrecomputed(self, precomputed_spectrogram):
+        """
+        Function for showing a spectrogram from the batch computation on its station plot
+        """
+        spectrogram_key, spectrogram = precomputed_spectrogram
+
+        if spectrogram_key in self.spectrogram_plots:
+            self.spectrogram_plots[spectrogram_key].clear()
+            self.spectrogram_plots[spectrogram_key].addItem(ImageItem(spectrogram[0]))
+
+class SpectrogramBatchManager(QObject):
     """
-    This object calculates spectrograms in a background thread and returns them to the spectrogram widget.
+    This class precomputes the spectrograms of all selected stations of the focused event on a process pool and puts them to the spectrogram cache. The spectrogram windows only display the results.
+    """
+    spectrogram_ready = pyqtSignal('PyQt_PyObject')
+    spectrograms_requested = pyqtSignal()
+
+    def __init__(self, parent, station_list, spectrogram_cache, filter_stats):
+        QObject.__init__(self, parent)
+        self.station_list = station_list
+        self.spectrogram_cache = spectrogram_cache
+        self.filter_stats = filter_stats
+
+        self.process_pool = None
+        self.current_keys = []
+        self.waiting_jobs = None
+        self.generation = 0
+
+        self.batch_thread = SpectrogramBatchThread()
+        self.batch_thread.signal.connect(self.spectrogramComputed)
+        self.batch_thread.finished.connect(self.batchFinished)
+
+    def precompute(self):
+        """
+        Function for starting the computation of the spectrograms of the selected stations of the focused event that are not in the cache. A running batch is interrupted and the new batch is started when it has stopped.
+        """
+        if self.station_list.event is None or self.station_list.waveform_traces is None:
+            return
+
+        tr_filter = self.filter_stats.getCurrentFilter()
+        self.current_keys = []
+        jobs = []
+
+        for station_name, distance in self.station_list.getOrderedStationList():
+            trace, p_pick = self.station_list.getCurrentTraceAndPPickForStation(station_name)
+
+            if trace is None or p_pick is None:
+                continue
+
+            spectrogram_key = createSpectrogramKey(self.station_list.event.event_id, trace, p_pick, tr_filter)
+            self.current_keys.append([station_name, spectrogram_key])
+
+            if spectrogram_key in self.spectrogram_cache:
+                continue
+
+            jobs.append([
+                spectrogram_key,
+                numpy.array(trace.data),
+                trace.stats['sampling_rate'],
+                trace.stats['starttime'].timestamp,
+                UTCDateTime(p_pick).timestamp,
+                list(tr_filter),
+            ])
+
+        self.spectrograms_requested.emit()
+        self.generation += 1
+
+        if self.batch_thread.isRunning():
+            self.waiting_jobs = jobs
+            self.batch_thread.interrupt = True
+        elif jobs:
+            self.startBatch(jobs)
+
+    def startBatch(self, jobs):
+        """
+        Start the batch thread with a list of jobs
+        """
+        if self.process_pool is None:
+            self.process_pool = ProcessPoolExecutor(
+                max_workers = SPECTRO_PROCESS_COUNT,
+                mp_context = multiprocessing.get_context('spawn')
+            )
+
+        self.batch_thread.process_pool = self.process_pool
+        self.batch_thread.jobs = jobs
+        self.batch_thread.generation = self.generation
+        self.batch_thread.interrupt = False
+        self.batch_thread.start()
+
+    def batchFinished(self):
+        """
+        Function that is called when the batch thread stops. Starts the batch that was requested while the thread was running.
+        """
+        if self.waiting_jobs:
+            self.startBatch(self.waiting_jobs)
+
+        self.waiting_jobs = None
+
+    def spectrogramComputed(self, computed_spectrogram):
+        """
+        Function for putting a spectrogram computed by the batch thread to the cache. Results of interrupted batches are still valid and are cached as well.
+        """
+        generation, spectrogram_key, spectrogram = computed_spectrogram
+
+        if spectrogram is None:
+            return
+
+        self.spectrogram_cache.putSpectrogram(spectrogram_key, spectrogram)
+        self.spectrogram_ready.emit([spectrogram_key, spectrogram])
+
+    def shutdown(self):
+        """
+        Stop the batch thread and the process pool
+        """
+        self.waiting_jobs = None
+        self.batch_thread.interrupt = True
+        self.batch_thread.wait()
+
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait = False)
+            self.process_pool = None
+
+class SpectrogramBatchThread(QThread):
+    """
+    This object submits a batch of spectrogram computations to a process pool and emits every result as soon as it is done
     """
     signal = pyqtSignal('PyQt_PyObject')
 
-    def __init__(self, filter_stats, spectrogram_id):
+    def __init__(self):
         QThread.__init__(self)
 
-        self.waveform_trace = None
-        self.p_pick = None
+        self.process_pool = None
+        self.jobs = []
+        self.generation = 0
         self.interrupt = False
-        self.running = False
-        self.filter_stats = filter_stats
-        self.spectrogram_id = spectrogram_id
 
     def run(self):
         """
-        Calculate spectrogram from trace
+        Compute the spectrograms of the jobs
         """
-        print("Fetching window {0}".format(self.spectrogram_id))
-        if self.p_pick is None:
-            self.signal.emit([self.spectrogram_id, None, None, None])
-            return
-        start_time = self.p_pick - SPECTRO_WINDOW_OFFSET
-        end_time = start_time + SPECTRO_WINDOW_SIZE
+        futures = {}
 
-        filtered_trace = filterTrace(self.filter_stats.getCurrentFilter(), self.waveform_trace)
-        filtered_trace.trim(UTCDateTime(start_time), UTCDateTime(end_time))
+        for spectrogram_key, data, sampling_rate, start_time, p_pick_time, tr_filter in self.jobs:
+            future = self.process_pool.submit(computeSpectrogram, data, sampling_rate, start_time, p_pick_time, tr_filter)
+            futures[future] = spectrogram_key
 
-        if self.interrupt:
-            self.signal.emit([self.spectrogram_id, None, None, None])
-            return
+        for future in as_completed(futures):
+            if self.interrupt:
+                for f in futures:
+                    f.cancel()
+                return
 
-        segment_length = int(len(filtered_trace.data) * SPECTRO_SEGMENT_LENGTH)
-        segment_overlap = int(segment_length * SPECTRO_SEGMENT_OVERLAP)
-        window = signal.hamming(segment_length)
-        sample_frequencies, segment_times, spectrogram = signal.spectrogram(
-            filtered_trace.data,
-            filtered_trace.stats.sampling_rate,
-            window = window,
-            noverlap = segment_overlap
-        )
+            try:
+                spectrogram = future.result()
+            except Exception as e:
+                print('Computing spectrogram failed: {0}'.format(e))
+                continue
 
-        if self.interrupt:
-            self.signal.emit([self.spectrogram_id, None, None, None])
-            return
+            self.signal.emit([self.generation, futures[future], spectrogram])
+
+class SpectrogramJob():
+    """
+    A single spectrogram calculation of a SpectrogramJobScheduler panel. The job is cancelled as soon as a newer job is submitted to the same panel.
+    """
+    def __init__(self, scheduler, panel_id, generation, waveform_trace, p_pick, spectrogram_key, tr_filter):
+        self.scheduler = scheduler
+        self.panel_id = panel_id
+        self.generation = generation
+        self.waveform_trace = waveform_trace
+        self.p_pick = p_pick
+        self.spectrogram_key = spectrogram_key
+        self.tr_filter = tr_filter
+
+    def isCancelled(self):
+        """
+        Check if a newer job has been submitted to the panel of this job
+        """
+        return self.scheduler.getGeneration(self.panel_id) != self.generation
 
-        log_spectrogram = numpy.log10(spectrogram.T)
-        max_val = numpy.max(log_spectrogram)
-        min_val = numpy.min(log_spectrogram)
-        value_delta = max_val - min_val
-        color_map = colormap.get_cmap('hsv')
+class SpectrogramJobScheduler(QObject):
+    """
+    This class schedules the spectrogram calculations of the panels of a spectrogram window. Every submit gives the panel a new generation id. Only the newest job of a panel is kept waiting, and a running job stops at the next chunk once its generation is no longer the newest. Each panel has its own SpectrogramCalculatorThread that runs the jobs of the panel.
+    """
+    signal = pyqtSignal('PyQt_PyObject')
 
-        result = ImageItem(numpy.array([[color_map((x - min_val) / value_delta) for x in y] for y in log_spectrogram]))
+    def __init__(self, parent, panel_count):
+        QObject.__init__(self, parent)
 
-        if self.interrupt:
-            self.signal.emit([self.spectrogram_id, None, None, None])
-            return
+        self.lock = threading.Lock()
+        self.generations = [0] * panel_count
+        self.pending_jobs = [None] * panel_count
+
+        self.calculator_threads = []
+        for panel_id in range(panel_count):
+            calculator_thread = SpectrogramCalculatorThread(self, panel_id)
+            calculator_thread.signal.connect(self.signal)
+            calculator_thread.finished.connect(self.startPendingJobs)
+            self.calculator_threads.append(calculator_thread)
+
+    def getGeneration(self, panel_id):
+        """
+        Get the generation id of the newest job of a panel
+        """
+        with self.lock:
+            return self.generations[panel_id]
+
+    def submit(self, panel_id, waveform_trace, p_pick, spectrogram_key, tr_filter):
+        """
+        Function for submitting a new spectrogram calculation to a panel. Cancels the job the panel is running and replaces its waiting job. Returns the generation id of the new job.
+        """
+        with self.lock:
+            self.generations[panel_id] += 1
+            job = SpectrogramJob(self, panel_id, self.generations[panel_id], waveform_trace, p_pick, spectrogram_key, list(tr_filter))
+            self.pending_jobs[panel_id] = job
+
+        self.calculator_threads[panel_id].start()
+
+        return job.generation
+
+    def cancel(self, panel_id):
+        """
+        Function for cancelling the running and the waiting job of a panel
+        """
+        with self.lock:
+            self.generations[panel_id] += 1
+            self.pending_jobs[panel_id] = None
+
+    def takeJob(self, panel_id):
+        """
+        Take the waiting job of a panel. Returns None if the panel has no waiting job. THIS FUNCTION IS ONLY CALLED FROM THE SPECTROGRAMCALCULATORTHREADS
+        """
+        with self.lock:
+            job = self.pending_jobs[panel_id]
+            self.pending_jobs[panel_id] = None
+
+        return job
+
+    def startPendingJobs(self):
+        """
+        Restart the threads of the panels that got a job while their thread was stopping
+        """
+        with self.lock:
+            panel_ids = [panel_id for panel_id, job in enumerate(self.pending_jobs) if job is not None]
+
+        for panel_id in panel_ids:
+            self.calculator_threads[panel_id].start()
+
+class SpectrogramCalculatorThread(QThread):
+    """
+    This object calculates the spectrograms of a panel of a SpectrogramJobScheduler in a background thread and returns them to the spectrogram widget.
+    """
+    signal = pyqtSignal('PyQt_PyObject')
+
+    def __init__(self, scheduler, panel_id):
+        QThread.__init__(self)
+
+        self.scheduler = scheduler
+        self.panel_id = panel_id
+
+    def run(self):
+        """
+        Calculate the spectrograms of the jobs of the panel until the panel has no waiting job
+        """
+        job = self.scheduler.takeJob(self.panel_id)
+
+        while job is not None:
+            self.signal.emit([self.panel_id, job.generation, job.spectrogram_key, self.calculateSpectrogram(job)])
+            job = self.scheduler.takeJob(self.panel_id)
+
+    def calculateSpectrogram(self, job):
+        """
+        Calculate spectrogram from the trace of a job. Returns None if the job was cancelled.
+        """
+        if job.p_pick is None or job.isCancelled():
+            return None
+
+        start_time = job.p_pick - SPECTRO_WINDOW_OFFSET
+        end_time = start_time + SPECTRO_WINDOW_SIZE
+
+        filtered_trace = filterTrace(job.tr_filter, job.waveform_trace)
+        filtered_trace.trim(UTCDateTime(start_time), UTCDateTime(end_time))
 
-        self.signal.emit([self.spectrogram_id, result, sample_frequencies, segment_times])
+        if job.isCancelled():
+            return None
 
+        return computeWindowSpectrogram(filtered_trace.data, filtered_trace.stats.sampling_rate, job.isCancelled)
@@ -0,0 +1,105 @@
+"""
+This module contains the filter engine of NorLyst. Filter coefficients are designed once per filter and sampling rate as second-order sections and traces with the same sampling rate and length are filtered together as one 2-D array.
+"""
+from functools import lru_cache
+
+import numpy
+from scipy import signal
+
+from obspy import Trace
+
+from norlyst.config import FILTER_TAPER_VALUE, FILTER_CORNERS
+
+@lru_cache(maxsize = 128)
+def getFilterSos(filter_type, freq_low, freq_high, sampling_rate, zerophase):
+    """
+    Function for designing the butterworth filter of a filter as second-order sections. The corner frequencies are read in the same way as in the FilterStats filters: BP uses both, LP the low and HP the high frequency. Corners above the nyquist frequency are handled like in ObsPy. Returns None if the filter does nothing at this sampling rate.
+    """
+    nyquist = 0.5 * sampling_rate
+
+    if filter_type == "BP":
+        low = freq_low / nyquist
+        high = freq_high / nyquist
+
+        if low - 1.0 > -1.0e-6:
+            return None
+        if high - 1.0 > -1.0e-6:
+            return signal.iirfilter(FILTER_CORNERS, low, btype = 'highpass', ftype = 'butter', output = 'sos')
+
+        return signal.iirfilter(FILTER_CORNERS, [low, high], btype = 'bandpass', ftype = 'butter', output = 'sos')
+    elif filter_type == "LP":
+        low = min(freq_low / nyquist, 1.0)
+
+        if low >= 1.0:
+            return None
+
+        return signal.iirfilter(FILTER_CORNERS, low, btype = 'lowpass', ftype = 'butter', output = 'sos')
+    elif filter_type == "HP":
+        high = freq_high / nyquist
+
+        if high - 1.0 > -1.0e-6:
+            return None
+
+        return signal.iirfilter(FILTER_CORNERS, high, btype = 'highpass', ftype = 'butter', output = 'sos')
+
+    return None
+
+@lru_cache(maxsize = 128)
+def getTaperWindow(npts):
+    """
+    Function for creating the hann taper window of FILTER_TAPER_VALUE for traces of npts samples
+    """
+    wlen = int(FILTER_TAPER_VALUE * npts)
+    taper_sides = numpy.hanning(2 * wlen + 1)
+
+    return numpy.hstack((taper_sides[:wlen], numpy.ones(npts - 2 * wlen), taper_sides[len(taper_sides) - wlen:]))
+
+def filterArray(tr_filter, data_array, sampling_rate):
+    """
+    Function for filtering the rows of a 2-D array of traces with the same sampling rate. The rows are detrended, tapered and filtered with the filter. Returns a new array.
+    """
+    data_array = signal.detrend(data_array.astype(numpy.float64), axis = 1, type = 'linear')
+    data_array *= getTaperWindow(data_array.shape[1])
+
+    sos = getFilterSos(tr_filter[1], tr_filter[2], tr_filter[3], sampling_rate, bool(tr_filter[4]))
+
+    if sos is None:
+        return data_array
+
+    data_array = signal.sosfilt(sos, data_array, axis = 1)
+
+    if tr_filter[4]:
+        data_array = signal.sosfilt(sos, data_array[:, ::-1], axis = 1)[:, ::-1]
+
+    return data_array
+
+def filterTraces(tr_filter, traces):
+    """
+    Function for filtering a list of traces with a filter of FilterStats. Traces with the same sampling rate and length are filtered in a single call. Returns filtered copies of the traces in the same order.
+    """
+    if tr_filter[0] == "No filter":
+        return [tr.copy() for tr in traces]
+
+    trace_groups = {}
+    for i, tr in enumerate(traces):
+        group_key = (tr.stats['sampling_rate'], tr.stats['npts'])
+
+        if group_key not in trace_groups:
+            trace_groups[group_key] = []
+        trace_groups[group_key].append(i)
+
+    filtered_traces = [None] * len(traces)
+
+    for (sampling_rate, npts), indices in trace_groups.items():
+        if npts == 0:
+            for i in indices:
+                filtered_traces[i] = traces[i].copy()
+            continue
+
+        data_array = numpy.vstack([traces[i].data for i in indices])
+        data_array = filterArray(tr_filter, data_array, sampling_rate)
+
+        for row, i in enumerate(indices):
+            filtered_traces[i] = Trace(data = numpy.ascontiguousarray(data_array[row]), header = traces[i].stats.copy())
+
+    return filtered_traces
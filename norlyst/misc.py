@@ -1,14 +1,78 @@
 """
 This module contains small helper classes and functions that are not clearly part of an other area of NorLyst
 """
+import copy
 import time
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from collections import OrderedDict
 
 from PyQt5.QtWidgets import QFrame, QPushButton, QCheckBox, QDoubleSpinBox, QLabel, QHBoxLayout, QVBoxLayout, QComboBox
 from PyQt5.QtCore import QTimer, QThread, pyqtSignal, QObject
 
+from obspy import UTCDateTime
+
 from waveformlocator.waveformLocator import WaveformLocator
 
 from norlyst.config import *
+from norlyst.waveformStore import WaveformStore
+from norlyst.filterEngine import filterTraces
+
+class EventHeader():
+    """
+    Class for the light weight event information needed for drawing the overview before the full NordicEvent has been loaded
+    """
+    def __init__(self, event_id, origin_time, latitude, longitude, magnitude, waveform_file_name):
+        self.event_id = event_id
+        self.origin_time = origin_time
+        self.latitude = latitude
+        self.longitude = longitude
+        self.magnitude = magnitude
+        self.waveform_file_name = waveform_file_name
+
+    def getWaveformFileName(self):
+        return self.waveform_file_name
+
+def createEventHeader(event):
+    """
+    Function for creating an EventHeader from a full NordicEvent
+    """
+    if event.getOriginTime() is None:
+        origin_time = None
+    else:
+        origin_time = event.getOriginTime().val
+
+    if event.waveform_h:
+        waveform_file_name = event.waveform_h[0].getWaveformFileName()
+    else:
+        waveform_file_name = None
+
+    return EventHeader(
+        event.event_id,
+        origin_time,
+        event.getLatitude().val,
+        event.getLongitude().val,
+        event.getMagnitude().val,
+        waveform_file_name
+    )
+
+def createEventHeaderFromRow(header_row):
+    """
+    Function for creating an EventHeader from a row of the GET_EVENT_HEADERS query
+    """
+    event_id, origin_date, origin_time, latitude, longitude, magnitude, waveform_info = header_row
+
+    if origin_date is None or origin_time is None:
+        origin_datetime = None
+    else:
+        origin_datetime = datetime.combine(origin_date, origin_time)
+
+    if waveform_info is not None:
+        waveform_info = waveform_info.strip()
+
+    return EventHeader(event_id, origin_datetime, latitude, longitude, magnitude, waveform_info)
 
 class EventClassification():
     """
@@ -30,6 +94,8 @@ class EventClassification():
 
         self.analysis = None
         self.event = None
+        self.analysis_header = None
+        self.event_header = None
         self.focus = False
 
     def listItemStringArray(self):
@@ -67,11 +133,34 @@ class EventClassification():
         else:
             return self.analysis
 
+    def getEventHeader(self):
+        """
+        Function for getting the header of the automatic event if there is no analysis and the header of the analysis event if there is one.
+        """
+        if self.analysis_header is None:
+            return self.event_header
+        else:
+            return self.analysis_header
+
+    def isLoaded(self):
+        """
+        Function for checking if the full NordicEvents of this classification have been loaded
+        """
+        return self.event is not None and (self._analysis_id == -1 or self.analysis is not None)
+
     def setEvent(self, event):
         self.event = event
+        self.event_header = createEventHeader(event)
 
     def setAnalysis(self, event):
         self.analysis = event
+        self.analysis_header = createEventHeader(event)
+
+    def setEventHeader(self, event_header):
+        self.event_header = event_header
+
+    def setAnalysisHeader(self, event_header):
+        self.analysis_header = event_header
 
     @property
     def analysis_id(self):
@@ -95,29 +184,67 @@ class EventClassification():
 
     @analysis_id.setter
     def analysis_id(self, value):
-        self.update_queue.addUpdateEvent(UpdateQueue.ANALYSIS_ID_UPDATE_OPERATION, self.ec_id, value)
+        self.update_queue.addUpdateEvent(UpdateQueue.ANALYSIS_ID_UPDATE_OPERATION, self.ec_id, value, self._analysis_id)
         self._analysis_id = value
 
     @priority.setter
     def priority(self, value):
-        self.update_queue.addUpdateEvent(UpdateQueue.PRIORITY_UPDATE_OPERATION, self.ec_id, value)
+        self.update_queue.addUpdateEvent(UpdateQueue.PRIORITY_UPDATE_OPERATION, self.ec_id, value, self._priority)
         self._priority = value
 
     @username.setter
     def username(self, value):
-        self.update_queue.addUpdateEvent(UpdateQueue.USERNAME_UPDATE_OPERATION, self.ec_id, value)
+        self.update_queue.addUpdateEvent(UpdateQueue.USERNAME_UPDATE_OPERATION, self.ec_id, value, self._username)
         self._username = value
 
     @unimportant.setter
     def unimportant(self, value):
-        self.update_queue.addUpdateEvent(UpdateQueue.UNIMPORTANT_UPDATE_OPERATION, self.ec_id, value)
+        self.update_queue.addUpdateEvent(UpdateQueue.UNIMPORTANT_UPDATE_OPERATION, self.ec_id, value, self._unimportant)
         self._unimportant = value
 
     @done.setter
     def done(self, value):
-        self.update_queue.addUpdateEvent(UpdateQueue.DONE_UPDATE_OPERATION, self.ec_id, value)
+        self.update_queue.addUpdateEvent(UpdateQueue.DONE_UPDATE_OPERATION, self.ec_id, value, self._done)
         self._done = value
 
+def indexEventClassifications(event_classifications):
+    """
+    Function for indexing event classifications by their event_id and analysis_id. Returns both indexes as dictionaries of lists.
+    """
+    event_id_index = {}
+    analysis_id_index = {}
+
+    for ec in event_classifications:
+        event_id_index.setdefault(ec.event_id, []).append(ec)
+        if ec.analysis_id != -1:
+            analysis_id_index.setdefault(ec.analysis_id, []).append(ec)
+
+    return event_id_index, analysis_id_index
+
+def attachEvents(event_classifications, events):
+    """
+    Function for attaching NordicEvents to the event classifications they belong to as the automatic event or the analysis. The classifications are indexed by event_id and analysis_id so that this runs in linear time.
+    """
+    event_id_index, analysis_id_index = indexEventClassifications(event_classifications)
+
+    for event in events:
+        for ec in event_id_index.get(event.event_id, []):
+            ec.setEvent(event)
+        for ec in analysis_id_index.get(event.event_id, []):
+            ec.setAnalysis(event)
+
+def attachEventHeaders(event_classifications, event_headers):
+    """
+    Function for attaching EventHeaders to the event classifications they belong to in the same way as attachEvents.
+    """
+    event_id_index, analysis_id_index = indexEventClassifications(event_classifications)
+
+    for event_header in event_headers:
+        for ec in event_id_index.get(event_header.event_id, []):
+            ec.setEventHeader(event_header)
+        for ec in analysis_id_index.get(event_header.event_id, []):
+            ec.setAnalysisHeader(event_header)
+
 class UpdateQueue():
     """
     Class containing necessary database updates in a queue
@@ -129,221 +256,954 @@ class UpdateQueue():
     DONE_UPDATE_OPERATION = 5
 
     def __init__(self, database_accesser):
-        self.queue_buffer = []
+        self.queue_buffer = {}
+        self.database_values = {}
         self.database_accesser = database_accesser
+        self.queue_lock = threading.Lock()
 
-        self.DATABASE_OPERATIONS = {
-            1: self.database_accesser.analysisIdUpdate,
-            2: self.database_accesser.priorityUpdate,
-            3: self.database_accesser.usernameUpdate,
-            4: self.database_accesser.setEventAsUnimportant,
-            5: self.database_accesser.setEventAsDone
+        self.queued_count = 0
+        self.coalesced_count = 0
+        self.dropped_count = 0
+        self.written_count = 0
+
+    def addUpdateEvent(self, operation, event_classification_id, value, previous_value):
+        """
+        Function for adding an update event. Only the latest value for each operation and event classification is kept and updates that return the field to its value in the database are dropped.
+        """
+        key = (operation, event_classification_id)
+
+        with self.queue_lock:
+            self.queued_count += 1
+
+            if key not in self.queue_buffer:
+                if value == previous_value:
+                    self.dropped_count += 1
+                    return
+
+                self.database_values[key] = previous_value
+                self.queue_buffer[key] = value
+                return
+
+            self.coalesced_count += 1
+
+            if value == self.database_values[key]:
+                del self.queue_buffer[key]
+                del self.database_values[key]
+            else:
+                self.queue_buffer[key] = value
+
+    def getQueueDepth(self):
+        """
+        Get the amount of updates currently waiting in the queue
+        """
+        return len(self.queue_buffer)
+
+    def getStatistics(self):
+        """
+        Get counters describing how much write traffic the queue has saved
+        """
+        return {
+            'queue_depth': self.getQueueDepth(),
+            'queued': self.queued_count,
+            'coalesced': self.coalesced_count,
+            'dropped': self.dropped_count,
+            'written': self.written_count,
         }
 
-    def addUpdateEvent(self, operation, event_classification_id, value):
+    def takeUpdateEvents(self):
         """
-        Function for adding an update event
+        Remove all queued updates from the queue and return them as a list of [operation, event_classification_id, value, database_value]
         """
-        self.queue_buffer.append([operation, event_classification_id, value])
+        with self.queue_lock:
+            update_events = [[key[0], key[1], value, self.database_values[key]] for key, value in self.queue_buffer.items()]
+            self.queue_buffer.clear()
+            self.database_values.clear()
 
-    def processQueue(self):
+        return update_events
+
+    def requeueUpdateEvents(self, update_events):
         """
-        Function for processing the updateQueue
+        Put updates taken with takeUpdateEvents back to the queue after a failed write. Values queued after the updates were taken are kept.
         """
-        if not self.queue_buffer:
-            return False
+        with self.queue_lock:
+            requeued_buffer = {}
 
-        for update_event in self.queue_buffer:
-            operation, event_classification_id, value = update_event
-            self.DATABASE_OPERATIONS[operation](event_classification_id, value)
+            for operation, event_classification_id, value, database_value in update_events:
+                key = (operation, event_classification_id)
 
-        self.queue_buffer.clear()
+                if key in self.queue_buffer:
+                    value = self.queue_buffer.pop(key)
+                    del self.database_values[key]
 
-        return True
+                if value != database_value:
+                    requeued_buffer[key] = value
+                    self.database_values[key] = database_value
 
-class WaveformAccessManager(QObject):
+            requeued_buffer.update(self.queue_buffer)
+            self.queue_buffer = requeued_buffer
+
+    def writeUpdateEvents(self, update_events, database_accesser = None):
+        """
+        Write updates taken with takeUpdateEvents to the database in a single transaction. Returns a list of [operation, event_classification_id, value, success] for each update.
+        """
+        if database_accesser is None:
+            database_accesser = self.database_accesser
+
+        results = database_accesser.batchUpdate([update_event[:3] for update_event in update_events])
+
+        with self.queue_lock:
+            self.written_count += len(update_events)
+
+        return [update_event[:3] + [success] for update_event, success in zip(update_events, results)]
+
+class LruCache():
     """
-    Class for fetching waveform data and assigning them to the event classifications
+    Least recently used cache limited by the total size of its values in bytes. Keeps hit, miss and eviction statistics and calls the eviction listeners with the key and value of every evicted entry.
     """
-    def __init__(self, parent):
-        QObject.__init__(self, parent)
+    def __init__(self, byte_budget, size_function):
+        self.byte_budget = byte_budget
+        self.size_function = size_function
+        self.total_size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self.__eviction_listeners = []
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def addEvictionListener(self, listener):
+        """
+        Add a function that will be called with the key and value of each evicted entry
+        """
+        self.__eviction_listeners.append(listener)
+
+    def get(self, key):
+        """
+        Get a value from the cache and mark it as the most recently used. Returns None if the key is not in the cache.
+        """
+        if key not in self._entries:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+
+        return self._entries[key][0]
+
+    def put(self, key, value):
+        """
+        Insert a value as the most recently used entry and evict the least recently used entries until the cache fits in its budget
+        """
+        self.pop(key)
+
+        size = self.size_function(value)
+        self._entries[key] = [value, size]
+        self.total_size += size
+
+        self.evict()
+
+    def pop(self, key):
+        """
+        Remove an entry from the cache without counting it as an eviction. Returns the value or None if the key is not in the cache.
+        """
+        if key not in self._entries:
+            return None
+
+        value, size = self._entries.pop(key)
+        self.total_size -= size
+
+        return value
+
+    def evict(self, reserved_size = 0):
+        """
+        Evict least recently used entries until the entries and reserved_size bytes fit in the budget
+        """
+        while self._entries and self.total_size + reserved_size > self.byte_budget:
+            key, entry = self._entries.popitem(last = False)
+            self.total_size -= entry[1]
+            self.evictions += 1
+
+            for listener in self.__eviction_listeners:
+                listener(key, entry[0])
+
+    def clear(self):
+        self._entries.clear()
+        self.total_size = 0
+
+    def getStatistics(self):
+        """
+        Get the size and hit, miss and eviction counters of the cache
+        """
+        return {
+            'entries': len(self._entries),
+            'size': self.total_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+def getWaveformSize(waveform):
+    """
+    Function for calculating the size of the trace data of a waveform dictionary in bytes
+    """
+    return sum(tr.data.nbytes for traces in waveform.values() for tr in traces)
+
+class WaveformCache(LruCache):
+    """
+    Waveform cache of the WaveformAccessManager. The waveform of the active event is pinned and never evicted, but its size is taken from the budget of the other entries. When the active event changes the previous active waveform becomes an old entry at the most recently used end. Prefetched waveforms enter as predictive entries. Focusing an event moves its cached entry, old or predictive, to active. Eviction always removes the least recently used entry whatever its kind, so predictive entries that are never looked at age out in the order they were fetched.
+    """
+    OLD_ENTRY = 'old'
+    PREDICTIVE_ENTRY = 'predictive'
+
+    def __init__(self, byte_budget = WAVEFORM_CACHE_BYTE_BUDGET):
+        LruCache.__init__(self, byte_budget, getWaveformSize)
+
         self.active_event_id = -1
-        self.next_active_id = -1
         self.active_waveform = None
+        self.active_size = 0
+        self.entry_kinds = {}
 
-        self.old_waveform_cache = {}
-        self.predictive_waveform_cache = {}
-        self.old_waveform_counter = 0
-        self.predictive_waveform_counter = 0
+        self.predictive_hits = 0
 
-        self.fetch_command_buffer = []
+    def pop(self, key):
+        self.entry_kinds.pop(key, None)
+        return LruCache.pop(self, key)
 
-        self.waveform_access_thread = WaveformAccessThread()
-        self.waveform_access_thread.signal.connect(self.setWaveform)
+    def evict(self, reserved_size = 0):
+        LruCache.evict(self, reserved_size + self.active_size)
 
-    def setActiveEvent(self, event):
+        for key in list(self.entry_kinds.keys()):
+            if key not in self._entries:
+                del self.entry_kinds[key]
+
+    def activate(self, event_id):
+        """
+        Move a cached waveform to active. Returns the waveform or None if the event is not in the cache.
+        """
+        if event_id not in self._entries:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if self.entry_kinds[event_id] == WaveformCache.PREDICTIVE_ENTRY:
+            self.predictive_hits += 1
+
+        waveform = self.pop(event_id)
+        self.setActive(event_id, waveform)
+
+        return waveform
+
+    def setActive(self, event_id, waveform):
         """
-        Set this event as the new active event
+        Set the waveform of the active event. The previous active waveform is moved to the old entries.
         """
-        if self.active_event_id == event.event_id:
+        if self.active_waveform is not None:
+            old_event_id, old_waveform = self.active_event_id, self.active_waveform
+            self.active_waveform = None
+            self.active_size = 0
+            self.putOld(old_event_id, old_waveform)
+
+        self.active_event_id = event_id
+        self.active_waveform = waveform
+        self.active_size = getWaveformSize(waveform)
+
+        self.evict()
+
+    def putOld(self, event_id, waveform):
+        """
+        Insert a waveform as an old entry
+        """
+        if event_id == self.active_event_id and self.active_waveform is not None:
             return
 
-        if event.event_id in list(self.old_waveform_cache.keys()):
-            self.insertEventFromOldToActive(event.event_id)
+        self.put(event_id, waveform)
+        if event_id in self._entries:
+            self.entry_kinds[event_id] = WaveformCache.OLD_ENTRY
+
+    def putPredictive(self, event_id, waveform):
+        """
+        Insert a prefetched waveform as a predictive entry
+        """
+        if event_id == self.active_event_id and self.active_waveform is not None:
             return
-        elif event.event_id in list(self.predictive_waveform_cache.keys()):
-            self.insertEventFromPredictiveToActive(event.event_id)
+
+        self.put(event_id, waveform)
+        if event_id in self._entries:
+            self.entry_kinds[event_id] = WaveformCache.PREDICTIVE_ENTRY
+
+    def getStatistics(self):
+        statistics = LruCache.getStatistics(self)
+        statistics['active_size'] = self.active_size
+        statistics['predictive_hits'] = self.predictive_hits
+
+        return statistics
+
+class FilteredTraceCache(LruCache):
+    """
+    Cache of filtered copies of traces keyed by the identity of the trace and the values of the filter. The original trace is kept in the entry so that its id cannot be reused by another trace while the entry exists. Entries of a waveform are removed with invalidateWaveform when the waveform is evicted from the waveform cache.
+    """
+    def __init__(self, byte_budget = FILTERED_TRACE_CACHE_BYTE_BUDGET):
+        LruCache.__init__(self, byte_budget, lambda x: x[1].data.nbytes)
+
+        self.trace_keys = {}
+        self.addEvictionListener(lambda key, value: self.__removeTraceKey(key))
+
+    def pop(self, key):
+        value = LruCache.pop(self, key)
+
+        if value is not None:
+            self.__removeTraceKey(key)
+
+        return value
+
+    def clear(self):
+        LruCache.clear(self)
+        self.trace_keys.clear()
+
+    def getFilteredTrace(self, tr_filter, trace):
+        """
+        Function for getting the filtered copy of a trace. The trace is filtered with filterTrace if it is not in the cache.
+        """
+        key = (id(trace), tuple(tr_filter))
+        entry = self.get(key)
+
+        if entry is not None and entry[0] is trace:
+            return entry[1]
+
+        filtered_trace = filterTrace(tr_filter, trace)
+        self.putFilteredTrace(tr_filter, trace, filtered_trace)
+
+        return filtered_trace
+
+    def putFilteredTrace(self, tr_filter, trace, filtered_trace):
+        """
+        Function for putting the filtered copy of a trace to the cache
+        """
+        key = (id(trace), tuple(tr_filter))
+
+        self.put(key, [trace, filtered_trace])
+
+        if key in self._entries:
+            if id(trace) not in self.trace_keys:
+                self.trace_keys[id(trace)] = set()
+            self.trace_keys[id(trace)].add(key)
+
+    def getFilteredTraces(self, tr_filter, traces):
+        """
+        Function for getting the filtered copies of a list of traces. The traces that are not in the cache are filtered together with filterTraces.
+        """
+        filtered_traces = [None] * len(traces)
+        missing_indices = []
+
+        for i, trace in enumerate(traces):
+            entry = self.get((id(trace), tuple(tr_filter)))
+
+            if entry is not None and entry[0] is trace:
+                filtered_traces[i] = entry[1]
+            else:
+                missing_indices.append(i)
+
+        if not missing_indices:
+            return filtered_traces
+
+        for i, filtered_trace in zip(missing_indices, filterTraces(tr_filter, [traces[i] for i in missing_indices])):
+            self.putFilteredTrace(tr_filter, traces[i], filtered_trace)
+            filtered_traces[i] = filtered_trace
+
+        return filtered_traces
+
+    def invalidateWaveform(self, event_id, waveform):
+        """
+        Remove the filtered traces of all traces of a waveform. Used as an eviction listener of the waveform cache.
+        """
+        for traces in waveform.values():
+            for tr in traces:
+                for key in list(self.trace_keys.get(id(tr), [])):
+                    if key in self._entries and self._entries[key][0][0] is tr:
+                        self.pop(key)
+
+    def __removeTraceKey(self, key):
+        """
+        Remove a key from the keys of its trace
+        """
+        keys = self.trace_keys.get(key[0])
+
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.trace_keys[key[0]]
+
+class SpectrogramCache(LruCache):
+    """
+    Cache of computed spectrograms keyed by the event, station, channel, p-pick, filter and segment settings of the spectrogram. Entries of an event are removed with invalidateWaveform when the waveform of the event is evicted from the waveform cache.
+    """
+    def __init__(self, byte_budget = SPECTROGRAM_CACHE_BYTE_BUDGET):
+        LruCache.__init__(self, byte_budget, lambda x: sum(array.nbytes for array in x))
+
+        self.event_keys = {}
+        self.addEvictionListener(lambda key, value: self.__removeEventKey(key))
+
+    def pop(self, key):
+        value = LruCache.pop(self, key)
+
+        if value is not None:
+            self.__removeEventKey(key)
+
+        return value
+
+    def clear(self):
+        LruCache.clear(self)
+        self.event_keys.clear()
+
+    def putSpectrogram(self, key, spectrogram):
+        """
+        Function for putting a spectrogram to the cache. The spectrogram is a list of the colored image, the sample frequencies and the segment times.
+        """
+        self.put(key, spectrogram)
+
+        if key in self._entries:
+            if key[0] not in self.event_keys:
+                self.event_keys[key[0]] = set()
+            self.event_keys[key[0]].add(key)
+
+    def invalidateWaveform(self, event_id, waveform):
+        """
+        Remove the spectrograms of an event. Used as an eviction listener of the waveform cache.
+        """
+        for key in list(self.event_keys.get(event_id, [])):
+            self.pop(key)
+
+    def __removeEventKey(self, key):
+        """
+        Remove a key from the keys of its event
+        """
+        keys = self.event_keys.get(key[0])
+
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.event_keys[key[0]]
+
+def createSpectrogramKey(event_id, trace, p_pick, tr_filter):
+    """
+    Function for creating the SpectrogramCache key of the spectrogram of a trace
+    """
+    return (
+        event_id,
+        trace.stats['station'],
+        trace.stats['channel'],
+        p_pick,
+        tuple(tr_filter),
+        (SPECTRO_SEGMENT_LENGTH, SPECTRO_SEGMENT_OVERLAP, SPECTRO_WINDOW_OFFSET, SPECTRO_WINDOW_SIZE, SPECTRO_COLOR_MAP),
+    )
+
+class WaveformFetchJob():
+    """
+    Class for a single waveform fetch of the WaveformAccessManager
+    """
+    def __init__(self, event, priority, sequence):
+        self.event = event
+        self.priority = priority
+        self.sequence = sequence
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+class WaveformAccessManager(QObject):
+    """
+    Class for fetching waveform data and assigning them to the event classifications. Fetches are run on a pool of WaveformAccessThreads in the order of their priority.
+    """
+    ACTIVE_PRIORITY = 0
+    PREDICTIVE_PRIORITY = 1
+    OLD_PRIORITY = 2
+
+    def __init__(self, parent):
+        QObject.__init__(self, parent)
+        self.next_active_id = -1
+
+        self.waveform_cache = WaveformCache()
+        self.waveform_cache.addEvictionListener(self.waveformEvicted)
+
+        self.fetch_queue = []
+        self.queued_jobs = {}
+        self.running_jobs = {}
+        self.fetch_sequence = 0
+        self.streamed_job = None
+
+        self.active_request_count = 0
+        self.prefetch_count = 0
+        self.prefetch_in_flight_hits = 0
+        self.prefetch_cancelled_count = 0
+        self.prefetch_wasted_count = 0
+
+        self.waveform_store = WaveformStore()
+
+        self.waveform_access_threads = []
+        for i in range(WAVEFORM_FETCH_THREAD_COUNT):
+            waveform_access_thread = WaveformAccessThread(self.waveform_store)
+            waveform_access_thread.signal.connect(self.setWaveform)
+            waveform_access_thread.station_signal.connect(self.setStationWaveforms)
+            waveform_access_thread.finished.connect(self.fetchFinished)
+            self.waveform_access_threads.append(waveform_access_thread)
+
+    def setActiveEvent(self, event):
+        """
+        Set this event as the new active event and start prefetching the events that are likely to be focused next
+        """
+        if self.waveform_cache.active_event_id == event.event_id:
             return
 
         self.next_active_id = event.event_id
+        self.streamed_job = None
+        self.active_request_count += 1
 
-        for i in range(len(self.fetch_command_buffer)):
-            if self.fetch_command_buffer[i][0].event_id == event.event_id:
-                if i > 1:
-                    self.fetch_command_buffer.insert(1, self.fetch_command_buffer.pop(i))
-                return
+        for job in list(self.queued_jobs.values()):
+            if job.priority == WaveformAccessManager.ACTIVE_PRIORITY and job.event.event_id != event.event_id:
+                self.queueJob(job.event, WaveformAccessManager.OLD_PRIORITY)
+
+        if self.waveform_cache.activate(event.event_id) is not None:
+            self.parent().setActiveEventToEventPage(self.waveform_cache.active_waveform)
+        else:
+            self.getWaveform(event)
 
-        self.getWaveform(event)
+        self.prefetchPredictions(event)
 
     def getWaveform(self, event, predictive = False):
         """
-        Function for starting the fetching operation on waveform access thread or buffering the fetching operation
+        Function for requesting the waveform of an event. Requests for an event that is already being fetched or queued are merged with the existing fetch.
         """
-        if self.waveform_access_thread.is_fetching:
-            self.fetch_command_buffer.append([event, predictive])
+        if predictive:
+            priority = WaveformAccessManager.PREDICTIVE_PRIORITY
         else:
-            self.fetch_command_buffer.append([event, predictive])
-            self.waveform_access_thread.is_fetching = True
-            self.waveform_access_thread.predictive_event = self.fetch_command_buffer[0][1]
-            self.waveform_access_thread.event = self.fetch_command_buffer[0][0]
-            self.waveform_access_thread.start()
+            priority = WaveformAccessManager.ACTIVE_PRIORITY
+
+        running_job = self.running_jobs.get(event.event_id)
+        if running_job is not None and not running_job.cancelled:
+            if priority < running_job.priority:
+                if running_job.priority == WaveformAccessManager.PREDICTIVE_PRIORITY:
+                    self.prefetch_in_flight_hits += 1
+                running_job.priority = priority
+            return
+
+        queued_job = self.queued_jobs.get(event.event_id)
+        if queued_job is not None:
+            if priority >= queued_job.priority:
+                return
+            if queued_job.priority == WaveformAccessManager.PREDICTIVE_PRIORITY:
+                self.prefetch_in_flight_hits += 1
 
-        if not predictive:
-            for e in self.getEventPredictions(event):
-                self.getWaveform(e, True)
+        self.queueJob(event, priority)
+        self.startNextFetch()
 
-    def setWaveform(self, waveform):
+    def queueJob(self, event, priority):
         """
-        Function for setting the fetched waveform from the access thread and removing the event from the buffer. THIS FUNCTION IS ONLY CALLED FROM THE WAVEFORMACCESSTHREAD
+        Put a fetch job to the fetch queue. A queued job of the same event is replaced.
         """
-        if self.next_active_id == self.waveform_access_thread.event.event_id:
-            self.insertEventToActive(self.waveform_access_thread.event.event_id, waveform)
-        elif self.waveform_access_thread.predictive_event:
-            self.insertEventToPredictive(self.waveform_access_thread.event.event_id, waveform)
-        else:
-            self.insertEventToOld(self.waveform_access_thread.event.event_id, waveform)
+        queued_job = self.queued_jobs.get(event.event_id)
+        if queued_job is not None:
+            queued_job.cancelled = True
 
-        self.fetch_command_buffer.pop(0)
-        self.waveform_access_thread.is_fetching = False
+        job = WaveformFetchJob(event, priority, self.fetch_sequence)
+        self.fetch_sequence += 1
 
-        if self.fetch_command_buffer:
-            self.waveform_access_thread.is_fetching = True
-            self.waveform_access_thread.predictive_event = self.fetch_command_buffer[0][1]
-            self.waveform_access_thread.event = self.fetch_command_buffer[0][0]
-            self.waveform_access_thread.start()
+        heapq.heappush(self.fetch_queue, job)
+        self.queued_jobs[event.event_id] = job
 
-    def insertEventToOld(self, event_id, waveform):
+    def cancelJob(self, job):
         """
-        Insert given event_id and waveform pair into the old_waveform_cache and if the buffer is old then remove the oldest pair from the buffer
+        Cancel a queued or running fetch job. A running job stops at the next trace and its result is thrown away.
         """
-        if len(self.old_waveform_cache.keys()) < WAVEFORM_OLD_BUFFER_SIZE:
-            self.old_waveform_cache[event_id] = [self.old_waveform_counter, waveform]
-        else:
-            smallest = next(iter(self.old_waveform_cache))
+        job.cancelled = True
 
-            for key in self.old_waveform_cache.keys():
-                if self.old_waveform_cache[smallest] > self.old_waveform_cache[key]:
-                    smallest = key
+        if self.queued_jobs.get(job.event.event_id) is job:
+            del self.queued_jobs[job.event.event_id]
+
+    def startNextFetch(self):
+        """
+        Start the jobs with the highest priority on the idle waveform access threads. Predictive fetches are run with a low thread priority.
+        """
+        for waveform_access_thread in self.waveform_access_threads:
+            if waveform_access_thread.is_fetching:
+                continue
+
+            job = None
+            while self.fetch_queue:
+                job = heapq.heappop(self.fetch_queue)
+                if not job.cancelled:
+                    break
+                job = None
+
+            if job is None:
+                return
 
-            del self.old_waveform_cache[smallest]
+            del self.queued_jobs[job.event.event_id]
+            self.running_jobs[job.event.event_id] = job
 
-            self.old_waveform_cache[event_id] = [self.old_waveform_counter, waveform]
+            waveform_access_thread.is_fetching = True
+            waveform_access_thread.fetch_job = job
 
-        self.old_waveform_counter += 1
+            if job.priority == WaveformAccessManager.PREDICTIVE_PRIORITY:
+                waveform_access_thread.start(QThread.LowPriority)
+            else:
+                waveform_access_thread.start()
 
-    def insertEventToPredictive(self, event_id, waveform):
+    def shutdown(self):
         """
-        Inset given event_id and waveform pair into the predictive_waveform_cache and remove the oldest value if the buffer is full
+        Cancel all queued and running fetch jobs and block until the waveform access threads have stopped
         """
-        if len(self.predictive_waveform_cache.keys()) < WAVEFORM_PREDICTIVE_BUFFER_SIZE:
-            self.predictive_waveform_cache[event_id] = [self.predictive_waveform_counter, waveform]
-        else:
-            smallest = next(iter(self.predictive_waveform_cache))
+        for job in list(self.queued_jobs.values()) + list(self.running_jobs.values()):
+            self.cancelJob(job)
+
+        self.fetch_queue = []
+
+        for waveform_access_thread in self.waveform_access_threads:
+            waveform_access_thread.wait()
 
-            for key in self.predictive_waveform_cache.keys():
-                if self.predictive_waveform_cache[smallest] > self.predictive_waveform_cache[key]:
-                    smallest = key
+    def setWaveform(self, fetch_result):
+        """
+        Function for setting the fetched waveform from an access thread. THIS FUNCTION IS ONLY CALLED FROM THE WAVEFORMACCESSTHREADS
+        """
+        waveform_access_thread, job, waveform = fetch_result
+        event_id = job.event.event_id
 
-            del self.predictive_waveform_cache[smallest]
+        if self.running_jobs.get(event_id) is job:
+            del self.running_jobs[event_id]
 
-            self.predictive_waveform_cache[event_id] = [self.predictive_waveform_counter, waveform]
+        if not job.cancelled and waveform is not None:
+            if self.next_active_id == event_id:
+                self.waveform_cache.setActive(event_id, waveform)
+                self.parent().setActiveEventToEventPage(waveform, self.streamed_job is job)
+            elif job.priority == WaveformAccessManager.PREDICTIVE_PRIORITY:
+                self.waveform_cache.putPredictive(event_id, waveform)
+            else:
+                self.waveform_cache.putOld(event_id, waveform)
 
-        self.predictive_waveform_counter += 1
+        if self.streamed_job is job:
+            self.streamed_job = None
 
-    def insertEventToActive(self, event_id, waveform):
+    def fetchFinished(self):
         """
-        Set the event as the active event and if there is an event before inserting, then insert the old event to the old_waveform_cache.
+        Function that is called when a waveform access thread has stopped. The next fetch is only started from here, because start does nothing on a thread that is still finishing.
         """
-        if self.active_waveform is not None:
-            self.insertEventFromActiveToOld()
-        self.active_waveform = waveform
-        self.active_event_id = event_id
-        self.parent().setActiveEventToEventPage(self.active_waveform)
+        self.sender().is_fetching = False
+        self.startNextFetch()
+
+    def setStationWaveforms(self, fetch_result):
+        """
+        Function for passing the stations of the active event to the event page while the rest of the event is still being read. THIS FUNCTION IS ONLY CALLED FROM THE WAVEFORMACCESSTHREADS
+        """
+        waveform_access_thread, job, station_waveforms = fetch_result
+
+        if job.cancelled or self.next_active_id != job.event.event_id:
+            return
+
+        if self.streamed_job is not job:
+            self.streamed_job = job
+            self.parent().setActiveEventToEventPage({})
 
-    def insertEventFromPredictiveToActive(self, event_id):
+        self.parent().addStationWaveformsToEventPage(station_waveforms)
+
+    def prefetchPredictions(self, event):
         """
-        Insert the event from predictive cache as the active event.
+        Queue predictive fetches for the predicted events of the given event. Queued and running predictive fetches that are not predicted anymore are cancelled.
         """
-        waveform = self.predictive_waveform_cache[event_id][1]
-        del self.predictive_waveform_cache[event_id]
-        self.insertEventToActive(event_id, waveform)
+        predictions = self.getEventPredictions(event)
+        predicted_ids = {e.event_id for e in predictions}
+
+        for jobs in [self.queued_jobs, self.running_jobs]:
+            for job in list(jobs.values()):
+                if job.cancelled or job.priority != WaveformAccessManager.PREDICTIVE_PRIORITY:
+                    continue
+                if job.event.event_id not in predicted_ids:
+                    self.cancelJob(job)
+                    self.prefetch_cancelled_count += 1
+
+        for e in predictions:
+            if e.event_id in self.waveform_cache or e.event_id in self.queued_jobs:
+                continue
+            if e.event_id in self.running_jobs and not self.running_jobs[e.event_id].cancelled:
+                continue
+
+            self.prefetch_count += 1
+            self.getWaveform(e, True)
 
-    def insertEventFromActiveToOld(self):
+    def getEventPredictions(self, event):
         """
-        Insert the active event into the old events cache and null the active event.
+        Get the events that are likely to be focused after the given event. These are the next events of the event list, events close to the given event in time and unfinished events with a priority. Only events that have been loaded from the database are returned.
         """
-        self.insertEventToOld(self.active_event_id, self.active_waveform)
-        self.active_waveform = None
-        self.active_event_id = -1
+        event_classifications = self.parent().event_classifications
+        focused_index = None
+
+        for i in range(len(event_classifications)):
+            if event.event_id in [event_classifications[i].event_id, event_classifications[i].analysis_id]:
+                focused_index = i
+                break
+
+        if focused_index is None:
+            return []
+
+        predicted_classifications = []
+        predicted_classifications.extend(event_classifications[focused_index + 1:focused_index + 1 + WAVEFORM_PREDICTION_COUNT])
+
+        focused_header = event_classifications[focused_index].getEventHeader()
+        if focused_header is not None and focused_header.origin_time is not None:
+            close_classifications = []
+
+            for ec in event_classifications:
+                ec_header = ec.getEventHeader()
+                if ec_header is None or ec_header.origin_time is None:
+                    continue
+
+                time_difference = abs(ec_header.origin_time - focused_header.origin_time)
+                if time_difference <= WAVEFORM_PREDICTION_TIME_WINDOW:
+                    close_classifications.append([time_difference, ec])
+
+            close_classifications.sort(key = lambda x: x[0])
+            predicted_classifications.extend(x[1] for x in close_classifications[:WAVEFORM_PREDICTION_COUNT + 1])
+
+        predicted_classifications.extend([ec for ec in event_classifications if not ec.done and ec.priority > -1][:WAVEFORM_PREDICTION_COUNT])
+
+        predictions = []
+        predicted_ids = {event.event_id}
+
+        for ec in predicted_classifications:
+            if ec.done or ec.unimportant:
+                continue
 
-    def insertEventFromOldToActive(self, event_id):
+            predicted_event = ec.getEvent()
+            if predicted_event is None or predicted_event.event_id in predicted_ids:
+                continue
+
+            predicted_ids.add(predicted_event.event_id)
+            predictions.append(predicted_event)
+
+        return predictions[:WAVEFORM_PREDICTION_MAX]
+
+    def waveformEvicted(self, event_id, waveform):
         """
-        Insert an event from the old_waveform_cache as the active event.
+        Function that is called when the waveform cache evicts a waveform. Counts the prefetched waveforms that were never focused.
         """
-        waveform = self.old_waveform_cache[event_id][1]
-        del self.old_waveform_cache[event_id]
-        self.insertEventToActive(event_id, waveform)
+        if self.waveform_cache.entry_kinds.get(event_id) == WaveformCache.PREDICTIVE_ENTRY:
+            self.prefetch_wasted_count += 1
 
-    def getEventPredictions(self, event):
+    def getPrefetchStatistics(self):
         """
-        Get prective events for a single event.
+        Get counters of the predictive prefetching. The hit rate is the share of focused events that were served from a finished or running prefetch.
         """
+        prefetch_hits = self.waveform_cache.predictive_hits + self.prefetch_in_flight_hits
 
-        return []
+        if self.active_request_count:
+            hit_rate = prefetch_hits / self.active_request_count
+        else:
+            hit_rate = 0.0
+
+        return {
+            'active_requests': self.active_request_count,
+            'prefetched': self.prefetch_count,
+            'hits': self.waveform_cache.predictive_hits,
+            'in_flight_hits': self.prefetch_in_flight_hits,
+            'cancelled': self.prefetch_cancelled_count,
+            'wasted': self.prefetch_wasted_count,
+            'hit_rate': hit_rate,
+        }
 
 class WaveformAccessThread(QThread):
     """
-    This class describes the object that handles the waveform requests on the background of the program.
+    This class describes the object that handles the waveform requests on the background of the program. Events are read from the local waveform store if possible. Otherwise the stations of an event are read concurrently from the archive, each station is emitted through station_signal as soon as it has been read and the whole event is written to the store.
     """
     signal = pyqtSignal('PyQt_PyObject')
+    station_signal = pyqtSignal('PyQt_PyObject')
 
-    def __init__(self):
+    def __init__(self, waveform_store):
         QThread.__init__(self)
 
+        self.waveform_store = waveform_store
         self.waveform_locator = WaveformLocator(WAVEFORM_LOCATOR_CONFIG_FILE)
-        self.event = None
-        self.predictive_event = False
+        self.station_locators = threading.local()
+        self.fetch_job = None
         self.is_fetching = False
 
+    def getStationLocator(self):
+        """
+        Function for getting the WaveformLocator of the current station reader thread
+        """
+        if not hasattr(self.station_locators, 'waveform_locator'):
+            self.station_locators.waveform_locator = WaveformLocator(WAVEFORM_LOCATOR_CONFIG_FILE)
+
+        return self.station_locators.waveform_locator
+
+    def readStationWaveforms(self, job, station_event):
+        """
+        Function for reading the traces of a single station event. Returns None if the job was cancelled during the read.
+        """
+        traces = []
+
+        for tr in self.getStationLocator().getEventWaveforms(station_event):
+            if job.cancelled:
+                return None
+            traces.append(tr)
+
+        return traces
+
     def run(self):
+        job = self.fetch_job
+        ordered_waveforms = None
+
+        try:
+            ordered_waveforms = self.waveform_store.getEventWaveforms(job.event)
+
+            if ordered_waveforms is None:
+                ordered_waveforms, complete = self.readEventWaveforms(job)
+
+                if complete and ordered_waveforms:
+                    self.waveform_store.putEventWaveforms(job.event, ordered_waveforms)
+        except Exception as e:
+            print('Fetching the waveforms of event {0} failed: {1}'.format(job.event.event_id, e))
+        finally:
+            self.signal.emit([self, job, ordered_waveforms])
+
+    def readEventWaveforms(self, job):
+        """
+        Function for reading the waveforms of the event of the job from the archive. Returns the waveforms and whether all stations were read. The waveforms are None if the job was cancelled.
+        """
         ordered_waveforms = {}
-        if self.event is not None:
-            for tr in self.waveform_locator.getEventWaveforms(self.event):
+        complete = True
+
+        station_events = getStationEvents(job.event)
+
+        if not WAVEFORM_PARALLEL_STATION_READS or len(station_events) < 2:
+            for tr in self.waveform_locator.getEventWaveforms(job.event):
+                if job.cancelled:
+                    return None, False
+
                 if tr.stats['station'] not in ordered_waveforms.keys():
                     ordered_waveforms[tr.stats['station']] = []
                 ordered_waveforms[tr.stats['station']].append(tr)
 
-        self.signal.emit(ordered_waveforms)
+            return trimEventWaveforms(job.event, ordered_waveforms), complete
+
+        with ThreadPoolExecutor(max_workers = WAVEFORM_STATION_READ_COUNT) as executor:
+            futures = [executor.submit(self.readStationWaveforms, job, station_event) for station_event in station_events]
+
+            for future in as_completed(futures):
+                try:
+                    traces = future.result()
+                except Exception as e:
+                    print('Reading station waveforms failed: {0}'.format(e))
+                    complete = False
+                    continue
+
+                if job.cancelled or traces is None:
+                    for f in futures:
+                        f.cancel()
+                    return None, False
+
+                station_waveforms = {}
+                for tr in traces:
+                    if tr.stats['station'] not in station_waveforms.keys():
+                        station_waveforms[tr.stats['station']] = []
+                    station_waveforms[tr.stats['station']].append(tr)
+
+                station_waveforms = trimEventWaveforms(job.event, station_waveforms)
+
+                for station, station_traces in station_waveforms.items():
+                    if station not in ordered_waveforms.keys():
+                        ordered_waveforms[station] = []
+                    ordered_waveforms[station].extend(station_traces)
+
+                if station_waveforms:
+                    self.station_signal.emit([self, job, station_waveforms])
+
+        return ordered_waveforms, complete
+
+def getEventTrimWindow(event):
+    """
+    Function for getting the window that is kept of the stations of the event that have no picks. The window starts WAVEFORM_TRIM_PRE before the origin time and ends WAVEFORM_TRIM_POST after the last pick of the event. Returns None if the event has neither origin time nor picks.
+    """
+    pick_times = [pick.observation_time for pick in event.data if pick.observation_time is not None]
+
+    if event.getOriginTime() is not None and isinstance(event.getOriginTime().val, datetime):
+        start_time = event.getOriginTime().val
+    elif pick_times:
+        start_time = min(pick_times)
+    else:
+        return None
+
+    if pick_times:
+        end_time = max(pick_times + [start_time])
+    else:
+        end_time = start_time
+
+    return [start_time - WAVEFORM_TRIM_PRE, end_time + WAVEFORM_TRIM_POST]
+
+def trimEventWaveforms(event, ordered_waveforms):
+    """
+    Function for trimming the traces of the event to the part that is looked at. Traces of a station with picks are cut to [first pick - WAVEFORM_TRIM_PRE, last pick + WAVEFORM_TRIM_POST] and the rest to the window of getEventTrimWindow. Traces are trimmed in place and stations left without data are dropped.
+    """
+    if not WAVEFORM_TRIM_ENABLED:
+        return ordered_waveforms
+
+    station_pick_times = {}
+    for pick in event.data:
+        if pick.observation_time is None:
+            continue
+        if pick.station_code not in station_pick_times:
+            station_pick_times[pick.station_code] = []
+        station_pick_times[pick.station_code].append(pick.observation_time)
+
+    event_window = getEventTrimWindow(event)
+    trimmed_waveforms = {}
+
+    for station, traces in ordered_waveforms.items():
+        if station in station_pick_times:
+            window = [min(station_pick_times[station]) - WAVEFORM_TRIM_PRE, max(station_pick_times[station]) + WAVEFORM_TRIM_POST]
+        else:
+            window = event_window
+
+        if window is None:
+            trimmed_waveforms[station] = traces
+            continue
+
+        trimmed_traces = []
+        for tr in traces:
+            tr.trim(UTCDateTime(window[0]), UTCDateTime(window[1]))
+
+            if tr.stats.npts > 0:
+                # trim leaves a view of the full trace, copy so that the rest can be freed
+                tr.data = tr.data.copy()
+                trimmed_traces.append(tr)
+
+        if trimmed_traces:
+            trimmed_waveforms[station] = trimmed_traces
+
+    return trimmed_waveforms
+
+def getStationEvents(event):
+    """
+    Function for splitting an event into shallow copies that each contain only the picks of a single station. The copies are ordered by the time of the first pick of the station so that the nearest stations are read first. Stations without pick times are read last.
+    """
+    station_picks = {}
+
+    for pick in event.data:
+        if pick.station_code not in station_picks:
+            station_picks[pick.station_code] = []
+        station_picks[pick.station_code].append(pick)
+
+    station_events = []
+    for picks in sorted(station_picks.values(), key = lambda x: min((pick.observation_time for pick in x if pick.observation_time is not None), default = datetime.max)):
+        station_event = copy.copy(event)
+        station_event.data = picks
+        station_events.append(station_event)
+
+    return station_events
 
 class FilterStats():
     """
@@ -540,16 +1400,4 @@ def filterTrace(tr_filter, trace):
     """
     Function for filtering a trace
     """
-    tr_copy = trace.copy()
-
-    if tr_filter[0] != "No filter":
-        tr_copy.detrend('linear')
-        tr_copy.taper(FILTER_TAPER_VALUE)
-        if tr_filter[1] == "BP":
-            tr_copy.filter('bandpass', freqmin = tr_filter[2], freqmax = tr_filter[3])
-        elif tr_filter[1] == "LP":
-            tr_copy.filter('lowpass', freq = tr_filter[2])
-        elif tr_filter[1] == "HP":
-            tr_copy.filter('highpass', freq = tr_filter[3])
-
-    return tr_copy
+    return filterTraces(tr_filter, [trace])[0]
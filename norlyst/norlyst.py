@@ -13,8 +13,8 @@ from PyQt5.QtGui import QIcon
 
 from norlyst.overviewPage import OverviewPage
 from norlyst.eventPage import EventPage
-from norlyst.databaseAccess import DatabaseAccesser
-from norlyst.misc import UpdateQueue, WaveformAccessManager
+from norlyst.databaseAccess import DatabaseAccesser, DatabaseWriterThread, NordicEventLoaderThread
+from norlyst.misc import UpdateQueue, WaveformAccessManager, attachEvents
 
 class NorLystMain(QMainWindow):
     """
@@ -42,7 +42,11 @@ class NorLystMain(QMainWindow):
         """
         Overloading function for saving all changes if the program exits
         """
-        self.norlyst_widget.saveChanges()
+        self.norlyst_widget.timer.stop()
+        self.norlyst_widget.stopLoadingEvents()
+        self.norlyst_widget.waveform_access_manager.shutdown()
+        self.norlyst_widget.waitForPendingWrites()
+        self.norlyst_widget.event_page.spectrogram_batch.shutdown()
 
     def initMenuBarItems(self):
         """
@@ -73,8 +77,21 @@ class NorLystWidget(QWidget):
         self.waveform_access_manager = WaveformAccessManager(self)
         self.database_accesser = DatabaseAccesser()
         self.update_queue = UpdateQueue(self.database_accesser)
+        self.database_writer_thread = DatabaseWriterThread(self.update_queue, self.database_accesser)
+        self.database_writer_thread.signal.connect(self.changesSaved)
+        self.event_loader_thread = NordicEventLoaderThread(self.database_accesser)
+        self.event_loader_thread.signal.connect(self.eventsLoaded)
+        self.event_loader_thread.finished.connect(self.eventLoaderFinished)
+        self.event_loader_generation = 0
+        self.waiting_event_ids = None
         self.overview_page = OverviewPage(self, self.database_accesser)
         self.event_page = EventPage(self, self.database_accesser)
+        self.waveform_access_manager.waveform_cache.addEvictionListener(
+            self.event_page.waveform_plot_widget.filtered_trace_cache.invalidateWaveform
+        )
+        self.waveform_access_manager.waveform_cache.addEvictionListener(
+            self.event_page.spectrogram_cache.invalidateWaveform
+        )
         self.event_classifications = []
 
         self.tabs.addTab(self.overview_page, 'Overview')
@@ -94,9 +111,28 @@ class NorLystWidget(QWidget):
 
     def saveChanges(self):
         """
-        Force update queue to update the rest of the changes.
+        Start writing the queued changes to the database on the background if the writer is not busy already.
         """
-        if self.update_queue.processQueue():
+        if self.database_writer_thread.isRunning() or not self.update_queue.getQueueDepth():
+            return
+
+        self.database_writer_thread.start()
+
+    def waitForPendingWrites(self):
+        """
+        Write all queued changes to the database and block until the writes are finished.
+        """
+        self.database_writer_thread.wait()
+
+        if self.update_queue.getQueueDepth():
+            self.database_writer_thread.start()
+            self.database_writer_thread.wait()
+
+    def changesSaved(self, results):
+        """
+        Function that is called when the database writer has finished. Redraws the program only if the write changed something.
+        """
+        if any(result[3] for result in results):
             self.setEventClassifications()
 
     def setEventsForChosenDate(self, chosen_date):
@@ -106,6 +142,63 @@ class NorLystWidget(QWidget):
         self.chosen_date = chosen_date
         self.event_classifications = self.database_accesser.getEventClassifications(chosen_date, self.update_queue)
         self.setEventClassifications()
+        self.startLoadingEvents()
+
+    def startLoadingEvents(self):
+        """
+        Start loading the full NordicEvents of the current event classifications on the background in the order they are listed. If the previous date is still loading, it is interrupted and the new date is loaded when the loader has stopped.
+        """
+        self.event_loader_generation += 1
+
+        event_ids = []
+        for ec in self.event_classifications:
+            if ec.event is None:
+                event_ids.append(ec.event_id)
+            if ec.analysis_id != -1 and ec.analysis is None:
+                event_ids.append(ec.analysis_id)
+
+        if self.event_loader_thread.isRunning():
+            self.waiting_event_ids = event_ids
+            self.event_loader_thread.interrupt = True
+        elif event_ids:
+            self.startEventLoader(event_ids)
+
+    def startEventLoader(self, event_ids):
+        """
+        Start the event loader thread with a list of event ids and the current generation
+        """
+        self.event_loader_thread.event_ids = event_ids
+        self.event_loader_thread.generation = self.event_loader_generation
+        self.event_loader_thread.interrupt = False
+        self.event_loader_thread.start()
+
+    def stopLoadingEvents(self):
+        """
+        Interrupt the event loader thread and block until it has stopped. Events that were waiting to be loaded are dropped.
+        """
+        self.waiting_event_ids = None
+        self.event_loader_thread.interrupt = True
+        self.event_loader_thread.wait()
+
+    def eventLoaderFinished(self):
+        """
+        Function that is called when the event loader thread stops. Starts loading the events that were requested while the thread was running.
+        """
+        if self.waiting_event_ids:
+            self.startEventLoader(self.waiting_event_ids)
+
+        self.waiting_event_ids = None
+
+    def eventsLoaded(self, loaded_page):
+        """
+        Function that is called when the event loader has fetched a page of events. Pages requested for an earlier date are ignored.
+        """
+        generation, events = loaded_page
+
+        if generation != self.event_loader_generation:
+            return
+
+        attachEvents(self.event_classifications, events)
 
     def setEventClassifications(self):
         """
@@ -136,6 +229,8 @@ class NorLystWidget(QWidget):
 
         for ec in self.event_classifications:
             if ec.focus:
+                if not ec.isLoaded():
+                    self.database_accesser.loadEventClassifications([ec])
                 self.waveform_access_manager.setActiveEvent(ec.getEvent())
 
         if self.event_classifications:
@@ -149,15 +244,26 @@ class NorLystWidget(QWidget):
             if ec.focus:
                 return ec.getEvent()
 
-    def setActiveEventToEventPage(self, waveform_traces):
+    def setActiveEventToEventPage(self, waveform_traces, streamed = False):
         """
-        Pass waveform data from station_list alongside with the new active event for plotting the current waveform
+        Pass waveform data from station_list alongside with the new active event for plotting the current waveform. If the stations were already streamed to the station list only the missing stations are added.
         """
-        self.event_page.station_list.setCurrentWaveforms(waveform_traces, self.getFocusedEvent())
+        if streamed:
+            self.event_page.station_list.updateCurrentWaveforms(waveform_traces)
+        else:
+            self.event_page.station_list.setCurrentWaveforms(waveform_traces, self.getFocusedEvent())
+
+        self.event_page.spectrogram_batch.precompute()
 
         if self.event_page.spectrogram_widget is not None and not self.event_page.spectrogram_widget.hidden:
             self.event_page.spectrogram_widget.setStationsFromNewEvent()
 
+    def addStationWaveformsToEventPage(self, station_waveforms):
+        """
+        Pass the waveforms of stations that were read while the rest of the active event is still being fetched
+        """
+        self.event_page.station_list.updateCurrentWaveforms(station_waveforms)
+
     def clearEventFocus(self):
         """
         Clear focus on all events and pass information forwards
@@ -5,7 +5,7 @@ import os
 import datetime
 
 from PyQt5.QtWidgets import (QWidget, QFrame, QGridLayout, QTextEdit, QPushButton, QVBoxLayout, QHBoxLayout, QLabel, QScrollArea, QDateTimeEdit)
-from PyQt5.QtCore import Qt, QUrl, QByteArray, QModelIndex, QAbstractListModel, QPointF, pyqtSlot, QPoint
+from PyQt5.QtCore import Qt, QUrl, QByteArray, QModelIndex, QAbstractListModel, QPointF, QVariant, pyqtSlot, QPoint
 from PyQt5.QtGui import QIcon, QColor
 from PyQt5.QtQml import QQmlApplicationEngine
 from PyQt5.QtQuickWidgets import QQuickWidget
@@ -118,7 +118,7 @@ class DailyLockManager(QWidget):
         Function for locking the chosen date of the daily lock manager
         """
         if self.lock_status:
-            self.parent().parent().parent().parent().saveChanges()
+            self.parent().parent().parent().parent().waitForPendingWrites()
             self.__database_access.unlockDayForUser(self.events_date)
         else:
             self.__database_access.lockDayForUser(self.events_date)
@@ -151,12 +151,15 @@ class OverviewMap(QQuickWidget):
         """
         Function for setting the event classifications for the overviewMap
         """
-        self.model.clearAll()
+        markers = []
+
         for ec in event_classifications:
             if ec.unimportant:
                 continue
 
-            if ec.getEvent().getLatitude().val is None:
+            event_header = ec.getEventHeader()
+
+            if event_header is None or event_header.latitude is None:
                 continue
 
             if ec.priority > 9999:
@@ -164,13 +167,15 @@ class OverviewMap(QQuickWidget):
             else:
                 ec_color = QColor(*CLASSIFICATION_COLOR_DICT[ec.classification])
 
-            self.model.addMarker(MapMarker(
+            markers.append(MapMarker(
                 ec.event_id,
-                QPointF(ec.getEvent().getLatitude().val, ec.getEvent().getLongitude().val),
+                QPointF(event_header.latitude, event_header.longitude),
                 ec_color,
                 ec.focus
             ))
 
+        self.model.setMarkers(markers)
+
     @pyqtSlot(int)
     def mapEvent(self, event_id):
         """
@@ -294,6 +299,66 @@ class MarkerModel(QAbstractListModel):
 
         return True
 
+    def setMarkers(self, markers):
+        """
+        Function for updating the model to the given markers by their event ids. Markers that are gone are removed and new markers are inserted in single ranges, and dataChanged is only emitted for the markers whose position, color or highlight changed.
+        """
+        new_markers = {}
+        for marker in markers:
+            new_markers[marker.eventId()] = marker
+
+        removed_rows = [row for row, marker in enumerate(self._markers) if marker.eventId() not in new_markers]
+
+        for first_row, last_row in reversed(getRowRanges(removed_rows)):
+            self.beginRemoveRows(QModelIndex(), first_row, last_row)
+            del self._markers[first_row:last_row + 1]
+            self.endRemoveRows()
+
+        changed_rows = []
+        changed_roles = set()
+
+        for row, marker in enumerate(self._markers):
+            new_marker = new_markers.pop(marker.eventId())
+            marker_changed = False
+
+            if marker.position() != new_marker.position():
+                marker.setPosition(new_marker.position())
+                changed_roles.add(MarkerModel.position_role)
+                marker_changed = True
+            if marker.color() != new_marker.color():
+                marker.setColor(new_marker.color())
+                changed_roles.add(MarkerModel.color_role)
+                marker_changed = True
+            if marker.highlight() != new_marker.highlight():
+                marker.setHighlight(new_marker.highlight())
+                changed_roles.add(MarkerModel.highlight_role)
+                marker_changed = True
+
+            if marker_changed:
+                changed_rows.append(row)
+
+        for first_row, last_row in getRowRanges(changed_rows):
+            self.dataChanged.emit(self.index(first_row), self.index(last_row), sorted(changed_roles))
+
+        if new_markers:
+            self.beginInsertRows(QModelIndex(), self.rowCount(), self.rowCount() + len(new_markers) - 1)
+            self._markers.extend(new_markers.values())
+            self.endInsertRows()
+
+def getRowRanges(rows):
+    """
+    Function for grouping a sorted list of rows into [first row, last row] ranges of consecutive rows
+    """
+    row_ranges = []
+
+    for row in rows:
+        if row_ranges and row_ranges[-1][1] == row - 1:
+            row_ranges[-1][1] = row
+        else:
+            row_ranges.append([row, row])
+
+    return row_ranges
+
 """
 OVERVIEW LIST FUNCTIONALITY
 ---------------------------
@@ -441,22 +506,22 @@ class EventBox(QFrame):
         self.__button_layout.setContentsMargins(5, 5, 5, 5)
 
         self.__event_classification = event_classification
-        event = self.__event_classification.getEvent()
+        event_header = self.__event_classification.getEventHeader()
 
-        self.__id_label = QLabel('ID: {0} - {1}'.format(event.event_id, event.waveform_h[0].getWaveformFileName()))
+        self.__id_label = QLabel('ID: {0} - {1}'.format(event_header.event_id, event_header.getWaveformFileName()))
         self.__id_label.setContentsMargins(5, 5, 5, 5)
         self.__id_label.setStyleSheet('background-color: rgb({0}, {1}, {2}); border-bottom: 1px solid black'.format(*CLASSIFICATION_COLOR_DICT[event_classification.classification]))
 
-        if event.getOriginTime() is None:
+        if event_header.origin_time is None:
             origin_time = "-"
         else:
-            origin_time = event.getOriginTime().val.strftime("%H:%M:%S")
+            origin_time = event_header.origin_time.strftime("%H:%M:%S")
 
         self.__event_values_text = QLabel('Time: {0}    Latitude: {1}    Longitude: {2}    Magnitude: {3}'.format(
             origin_time,
-            event.getLatitude().val,
-            event.getLongitude().val,
-            event.getMagnitude().val,)
+            event_header.latitude,
+            event_header.longitude,
+            event_header.magnitude,)
             , self)
         self.__event_values_text.setFixedHeight(20)
 
@@ -0,0 +1,158 @@
+"""
+This module contains the computation of the spectrogram images of NorLyst. The functions only work on numpy arrays and numbers so that they can be run on a process pool. Running the module compares the lookup table colouring with colouring every pixel separately on realistic window sizes.
+"""
+import time
+from functools import lru_cache
+
+import numpy
+
+from scipy import signal
+
+from matplotlib import colormaps
+
+from norlyst.config import (SPECTRO_COLOR_MAP, SPECTRO_COLOR_LUT_SIZE, SPECTRO_SEGMENT_LENGTH, SPECTRO_SEGMENT_OVERLAP,
+                            SPECTRO_WINDOW_OFFSET, SPECTRO_WINDOW_SIZE, SPECTRO_CHUNK_SIZE)
+from norlyst.filterEngine import filterArray
+
+@lru_cache(maxsize = 8)
+def getColorMapLut(color_map_name, lut_size = SPECTRO_COLOR_LUT_SIZE):
+    """
+    Function for sampling a matplotlib colormap into a lookup table of lut_size RGBA colors as uint8 values
+    """
+    color_map = colormaps[color_map_name]
+
+    return (color_map(numpy.linspace(0.0, 1.0, lut_size)) * 255).astype(numpy.uint8)
+
+def colorSpectrogram(log_spectrogram, color_map_name = SPECTRO_COLOR_MAP, is_cancelled = None):
+    """
+    Function for coloring a log spectrogram with a colormap. The values are scaled between the minimum and maximum of the spectrogram and mapped through the lookup table of the colormap SPECTRO_CHUNK_SIZE rows at a time. is_cancelled is checked between the chunks. Returns an uint8 RGBA image or None if the computation was cancelled.
+    """
+    lut = getColorMapLut(color_map_name)
+
+    min_val = numpy.min(log_spectrogram)
+    value_delta = numpy.max(log_spectrogram) - min_val
+
+    if value_delta == 0:
+        value_delta = 1.0
+
+    image = numpy.empty(log_spectrogram.shape + (lut.shape[1],), dtype = numpy.uint8)
+
+    for chunk_start in range(0, len(log_spectrogram), SPECTRO_CHUNK_SIZE):
+        if is_cancelled is not None and is_cancelled():
+            return None
+
+        chunk = log_spectrogram[chunk_start:chunk_start + SPECTRO_CHUNK_SIZE]
+        lut_indices = ((chunk - min_val) * ((len(lut) - 1) / value_delta)).astype(numpy.intp)
+        numpy.clip(lut_indices, 0, len(lut) - 1, out = lut_indices)
+
+        image[chunk_start:chunk_start + SPECTRO_CHUNK_SIZE] = lut[lut_indices]
+
+    return image
+
+def computeSpectrogram(data, sampling_rate, start_time, p_pick_time, tr_filter, is_cancelled = None):
+    """
+    Function for computing the colored spectrogram of a trace. The data is filtered with the filter, cut to the spectrogram window around the p-pick and colored with colorSpectrogram. start_time and p_pick_time are POSIX timestamps of the first sample and the p-pick. Returns a list of the image, the sample frequencies and the segment times or None if the window is too short for a spectrogram or the computation was cancelled.
+    """
+    if tr_filter[0] != "No filter":
+        data = filterArray(tr_filter, data[numpy.newaxis, :], sampling_rate)[0]
+
+    window_start = p_pick_time - SPECTRO_WINDOW_OFFSET.total_seconds()
+    window_end = window_start + SPECTRO_WINDOW_SIZE.total_seconds()
+
+    first_index = max(int(round((window_start - start_time) * sampling_rate)), 0)
+    last_index = min(int(round((window_end - start_time) * sampling_rate)) + 1, len(data))
+
+    window_data = data[first_index:last_index]
+
+    return computeWindowSpectrogram(window_data, sampling_rate, is_cancelled)
+
+def computeWindowSpectrogram(window_data, sampling_rate, is_cancelled = None):
+    """
+    Function for computing the colored spectrogram of data that has already been filtered and cut to the spectrogram window. The short-time fourier transform is computed SPECTRO_CHUNK_SIZE segments at a time and is_cancelled is checked between the chunks. Returns a list of the image, the sample frequencies and the segment times or None if the window is too short for a spectrogram or the computation was cancelled.
+    """
+    segment_length = int(len(window_data) * SPECTRO_SEGMENT_LENGTH)
+
+    if segment_length < 2:
+        return None
+
+    segment_overlap = int(segment_length * SPECTRO_SEGMENT_OVERLAP)
+    segment_step = segment_length - segment_overlap
+    segment_count = (len(window_data) - segment_overlap) // segment_step
+    window = signal.windows.hamming(segment_length)
+
+    spectrogram_chunks = []
+    segment_time_chunks = []
+
+    for first_segment in range(0, segment_count, SPECTRO_CHUNK_SIZE):
+        if is_cancelled is not None and is_cancelled():
+            return None
+
+        last_segment = min(first_segment + SPECTRO_CHUNK_SIZE, segment_count)
+        chunk_start = first_segment * segment_step
+        chunk_end = (last_segment - 1) * segment_step + segment_length
+
+        sample_frequencies, segment_times, spectrogram = signal.spectrogram(
+            window_data[chunk_start:chunk_end],
+            sampling_rate,
+            window = window,
+            noverlap = segment_overlap
+        )
+
+        spectrogram_chunks.append(spectrogram)
+        segment_time_chunks.append(segment_times + chunk_start / sampling_rate)
+
+    spectrogram = numpy.concatenate(spectrogram_chunks, axis = 1)
+    segment_times = numpy.concatenate(segment_time_chunks)
+
+    image = colorSpectrogram(numpy.log10(spectrogram.T), is_cancelled = is_cancelled)
+
+    if image is None:
+        return None
+
+    return [image, sample_frequencies, segment_times]
+
+def colorSpectrogramPerPixel(log_spectrogram, color_map_name = SPECTRO_COLOR_MAP):
+    """
+    Function for coloring a log spectrogram by calling the colormap once per pixel. This is how the spectrograms were colored before the lookup table and is only kept for benchmarking.
+    """
+    color_map = colormaps[color_map_name]
+
+    min_val = numpy.min(log_spectrogram)
+    value_delta = numpy.max(log_spectrogram) - min_val
+
+    return numpy.array([[color_map((x - min_val) / value_delta) for x in y] for y in log_spectrogram])
+
+def benchmarkColoring(sampling_rates = (20.0, 40.0, 100.0), repeats = 3):
+    """
+    Function for comparing colorSpectrogram and colorSpectrogramPerPixel on spectrograms of a SPECTRO_WINDOW_SIZE window of noise with the segment settings of NorLyst
+    """
+    for sampling_rate in sampling_rates:
+        data = numpy.random.randn(int(SPECTRO_WINDOW_SIZE.total_seconds() * sampling_rate))
+
+        segment_length = int(len(data) * SPECTRO_SEGMENT_LENGTH)
+        segment_overlap = int(segment_length * SPECTRO_SEGMENT_OVERLAP)
+        sample_frequencies, segment_times, spectrogram = signal.spectrogram(
+            data,
+            sampling_rate,
+            window = signal.windows.hamming(segment_length),
+            noverlap = segment_overlap
+        )
+        log_spectrogram = numpy.log10(spectrogram.T)
+
+        results = []
+        for color_function in [colorSpectrogramPerPixel, colorSpectrogram]:
+            start_time = time.perf_counter()
+            for i in range(repeats):
+                color_function(log_spectrogram)
+            results.append((time.perf_counter() - start_time) / repeats)
+
+        print('{0:6.1f} Hz {1:>10}: per pixel {2:8.4f} s, lookup table {3:8.5f} s, {4:7.0f}x'.format(
+            sampling_rate,
+            '{0}x{1}'.format(*log_spectrogram.shape),
+            results[0],
+            results[1],
+            results[0] / results[1]
+        ))
+
+if __name__ == '__main__':
+    benchmarkColoring()
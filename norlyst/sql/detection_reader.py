@@ -2,16 +2,18 @@
 This module contains small scripts for managing the database entries for NorLyst application.
 """
 import sys
+import argparse
 from os.path import realpath
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from psycopg2.extras import execute_values
 
 from nordb.core.usernameUtilities import log2nordb
-from nordb.database.nordicSearch import searchSameEvents
-from nordb.nordic.nordicEvent import NordicEvent
 from nordb.core.nordic import createStringMainHeader
 
 DETECTION_FILE_PATH = "/home/lysti/automaija"
 AUTOMATIC_SOLUTION_TYPE = 'A'
+SAME_EVENT_TIME_TOLERANCE = timedelta(seconds = 5)
 
 DOES_DAILY_LIST_EXIST = """
     SELECT
@@ -73,6 +75,57 @@ INSERT_WFDISC_TO_FINA_EVENT = """
         (%(event_id)s, %(waveform_info)s)
 """
 
+SEARCH_FINA_EVENTS = """
+    SELECT
+        nordic_header_main.origin_time, nordic_event.id
+    FROM
+        nordic_event, nordic_header_main
+    WHERE
+        nordic_event.id = nordic_header_main.event_id
+    AND
+        solution_type = 'FINA'
+    AND
+        nordic_header_main.origin_date = %(event_date)s
+    AND
+        nordic_header_main.origin_time = ANY(%(event_times)s)
+"""
+
+SEARCH_SAME_EVENTS = """
+    SELECT DISTINCT ON (detection.detection_index)
+        detection.detection_index, nordic_event.id
+    FROM
+        UNNEST(%(detection_times)s::TIMESTAMP[]) WITH ORDINALITY AS detection (detection_time, detection_index),
+        nordic_event, nordic_header_main
+    WHERE
+        nordic_event.id = nordic_header_main.event_id
+    AND
+        nordic_event.solution_type = %(solution_type)s
+    AND
+        nordic_header_main.origin_date BETWEEN CAST(detection.detection_time - %(time_tolerance)s AS DATE) AND CAST(detection.detection_time + %(time_tolerance)s AS DATE)
+    AND
+        nordic_header_main.origin_date + nordic_header_main.origin_time BETWEEN detection.detection_time - %(time_tolerance)s AND detection.detection_time + %(time_tolerance)s
+    ORDER BY
+        detection.detection_index,
+        ABS(EXTRACT(EPOCH FROM nordic_header_main.origin_date + nordic_header_main.origin_time - detection.detection_time)),
+        nordic_event.id
+"""
+
+BULK_INSERT_WFDISC_TO_FINA_EVENT = """
+    INSERT INTO
+        nordic_header_waveform (event_id, waveform_info)
+    VALUES
+        %s
+"""
+
+BULK_CREATE_NEW_EVENT_CLASSIFICATION = """
+    INSERT INTO
+        event_classification
+        (daily_id, priority, event_id, classification,
+        eqex, certainty, username, analysis_id)
+    VALUES
+        %s
+"""
+
 def readDetectionFile(file_date = datetime.now()):
     """
     read a detection file for a certain date and push it to the database
@@ -98,7 +151,6 @@ def readDetectionFile(file_date = datetime.now()):
         sys.exit(1)
 
     try:
-        entries = []
         filename = 'AutomLysti.{0}{1:03d}'.format(file_date.timetuple().tm_year, file_date.timetuple().tm_yday)
 
         type_number = 1
@@ -135,20 +187,10 @@ def readDetectionFile(file_date = datetime.now()):
                         })
 
             if len(line) > 80 and line[79] == '1':
-                search_event = NordicEvent()
-                search_event.main_h.append(createStringMainHeader(line, False))
-                found_events = searchSameEvents(search_event)
-
-                if not found_events:
-                    raise Exception('No event found for line: {0}'.format(line))
-
-                event_id = -1
-                for event in found_events:
-                    if event.solution_type == AUTOMATIC_SOLUTION_TYPE:
-                        event_id = found_events[0].event_id
+                event_id = searchSameEventIds(cur, [createStringMainHeader(line, False)])[0]
 
-                if event_id == -1:
-                    raise Exception('No event with correct solution_type found. Required type: {0}'.format(AUTOMATIC_SOLUTION_TYPE))
+                if event_id is None:
+                    raise Exception('No event with correct solution_type found for line: {0}. Required type: {1}'.format(line, AUTOMATIC_SOLUTION_TYPE))
 
                 detection_file.readline()
                 class_vals = readClassificationLine(detection_file.readline())
@@ -189,6 +231,149 @@ def readDetectionFile(file_date = datetime.now()):
     conn.commit()
     conn.close()
 
+def searchSameEventIds(cur, main_headers):
+    """
+    Function for finding the automatic events of main headers read from a detection file. An event matches a header if it has the AUTOMATIC_SOLUTION_TYPE and its origin time is within SAME_EVENT_TIME_TOLERANCE of the header, and the closest match is used. Both the per-line and the bulk reader use this so that they resolve the same events. Returns the event ids in the order of the headers with None for headers without a match.
+    """
+    event_ids = [None] * len(main_headers)
+
+    if not main_headers:
+        return event_ids
+
+    cur.execute(SEARCH_SAME_EVENTS,
+               {
+                    'detection_times': [datetime.combine(main_header.origin_date, main_header.origin_time) for main_header in main_headers],
+                    'solution_type': AUTOMATIC_SOLUTION_TYPE,
+                    'time_tolerance': SAME_EVENT_TIME_TOLERANCE
+               })
+
+    for detection_index, event_id in cur.fetchall():
+        event_ids[detection_index - 1] = event_id
+
+    return event_ids
+
+def getDailyListId(conn, list_date):
+    """
+    Function for getting the id of the daily list of a date and creating the list if it does not exist yet
+    """
+    cur = conn.cursor()
+
+    cur.execute(DOES_DAILY_LIST_EXIST, {'new_date':list_date})
+    existing_id = cur.fetchone()
+
+    if existing_id is not None:
+        return existing_id[0]
+
+    cur.execute(CREATE_NEW_DAILY_LIST, {'author_lock':None, 'daily_list_date':list_date})
+    daily_list_id = cur.fetchone()[0]
+    conn.commit()
+
+    return daily_list_id
+
+def parseDetectionFile(file_date):
+    """
+    Function for reading all detections of a detection file without touching the database. Returns a list of FINA detections as [event_time, wfdisc_name] and a list of automatic detections as [main_header, classification, class_vals].
+    """
+    fina_detections = []
+    automatic_detections = []
+
+    filename = 'AutomLysti.{0}{1:03d}'.format(file_date.timetuple().tm_year, file_date.timetuple().tm_yday)
+
+    type_number = 1
+    detection_file = open("{0}/{1}".format(DETECTION_FILE_PATH, filename), 'r')
+
+    for line in detection_file:
+        if line[:2] == '{0})'.format(type_number+1):    #See if the type of the detection changes
+            type_number += 1
+
+        if type_number == 4:
+            event_time = datetime.strptime(line[11:21] + '00', '%H.%M.%S.%f').time()
+            wfdisc_name = detection_file.readline().strip()
+            fina_detections.append([event_time, wfdisc_name.upper()])
+
+        if len(line) > 80 and line[79] == '1':
+            main_header = createStringMainHeader(line, False)
+            detection_file.readline()
+            class_vals = readClassificationLine(detection_file.readline())
+            automatic_detections.append([main_header, type_number, class_vals])
+
+    detection_file.close()
+
+    return fina_detections, automatic_detections
+
+def bulkReadDetectionFile(file_date, conn):
+    """
+    Bulk version of readDetectionFile. The whole file is parsed first, the FINA and automatic events are resolved with one query each, the automatic events with the same time window as readDetectionFile, and the classifications are written with multi-row inserts in a single transaction.
+    """
+    cur = conn.cursor()
+
+    try:
+        daily_list_id = getDailyListId(conn, file_date.date())
+    except Exception as e:
+        conn.rollback()
+        print('Failed to create a new daily list item into the postgresql database: {0}'.format(e))
+        return False
+
+    try:
+        fina_detections, automatic_detections = parseDetectionFile(file_date)
+
+        cur.execute(SEARCH_FINA_EVENTS, {'event_date':file_date.date(), 'event_times':[detection[0] for detection in fina_detections]})
+        fina_ids = {}
+        for event_time, event_id in cur.fetchall():
+            fina_ids.setdefault(event_time, event_id)
+
+        automatic_ids = searchSameEventIds(cur, [detection[0] for detection in automatic_detections])
+
+        wfdisc_rows = []
+        classification_rows = []
+
+        for event_time, wfdisc_name in fina_detections:
+            if event_time not in fina_ids:
+                raise Exception('No FINA event found for time: {0}'.format(event_time))
+
+            wfdisc_rows.append((fina_ids[event_time], wfdisc_name))
+            classification_rows.append((daily_list_id, -1, fina_ids[event_time], 4, None, None, '', -1))
+
+        for (main_header, classification, class_vals), event_id in zip(automatic_detections, automatic_ids):
+            if event_id is None:
+                raise Exception('No event with correct solution_type found for {0} {1}. Required type: {2}'.format(main_header.origin_date, main_header.origin_time, AUTOMATIC_SOLUTION_TYPE))
+
+            if not class_vals:
+                classification_rows.append((daily_list_id, -1, event_id, classification, None, None, '', -1))
+            else:
+                classification_rows.append((daily_list_id, -1, event_id, classification, class_vals[1], class_vals[1], '', -1))
+
+        execute_values(cur, BULK_INSERT_WFDISC_TO_FINA_EVENT, wfdisc_rows)
+        execute_values(cur, BULK_CREATE_NEW_EVENT_CLASSIFICATION, classification_rows)
+        conn.commit()
+
+    except Exception as e:
+        print('{0}: {1}'.format(file_date.date(), e))
+        conn.rollback()
+        cur.execute(CREATE_NEW_ERROR_LOG,
+                   {
+                        'daily_list_id': daily_list_id,
+                        'error_log': str(e)
+                   })
+        conn.commit()
+        return False
+
+    return True
+
+def bulkReadDetectionFiles(start_date, end_date):
+    """
+    Function for reading the detection files of every date from start_date to end_date with bulkReadDetectionFile using a single database connection
+    """
+    conn = log2nordb()
+
+    try:
+        file_date = start_date
+        while file_date <= end_date:
+            bulkReadDetectionFile(file_date, conn)
+            file_date += timedelta(days=1)
+    finally:
+        conn.close()
+
 def readClassificationLine(class_line):
     """
     Function for reading a classification line from a detection file
@@ -205,4 +390,26 @@ def readClassificationLine(class_line):
     return class_vals
 
 if __name__ == '__main__':
-    readDetectionFile(datetime.datetime.now() - datetime.timedelta(days=1))
+    parser = argparse.ArgumentParser(description = 'Read AutomLysti detection files into the NorLyst tables.')
+    parser.add_argument('start_date', nargs = '?', help = 'first date to read as YYYY-MM-DD, yesterday by default')
+    parser.add_argument('end_date', nargs = '?', help = 'last date to read as YYYY-MM-DD, start_date by default')
+    parser.add_argument('--bulk', action = 'store_true', help = 'read the files with set-based queries and multi-row inserts')
+    args = parser.parse_args()
+
+    if args.start_date is None:
+        start_date = datetime.now() - timedelta(days=1)
+    else:
+        start_date = datetime.strptime(args.start_date, '%Y-%m-%d')
+
+    if args.end_date is None:
+        end_date = start_date
+    else:
+        end_date = datetime.strptime(args.end_date, '%Y-%m-%d')
+
+    if args.bulk:
+        bulkReadDetectionFiles(start_date, end_date)
+    else:
+        file_date = start_date
+        while file_date <= end_date:
+            readDetectionFile(file_date)
+            file_date += timedelta(days=1)
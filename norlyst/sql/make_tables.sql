@@ -6,6 +6,8 @@
 -event classification has necessary information about an analysis of an event
 -event comment contains comments to events
 -macroseismic observation contains macroseismic observations from the public form
+
+Indexes and later schema changes are in the migrations folder. Run migrate.py after creating the tables.
  */
 
 CREATE TYPE day_status as ENUM ('unfinished', 'finished', 'locked');
@@ -86,9 +88,9 @@ CREATE TABLE error_logs(
 );
 
 GRANT
-    UPDATE
+    UPDATE (username, priority, analysis_id, unimportant, done)
 ON
-    event_classification (username, priority, analysis_id, unimportant, done)
+    event_classification
 TO
     default_users;
 
@@ -0,0 +1,171 @@
+"""
+This module contains a small script for applying the versioned schema migrations of the NorLyst tables and for checking that the hot queries of NorLyst use the indexes.
+"""
+import os
+import sys
+import json
+import argparse
+from datetime import date
+
+from nordb.core.usernameUtilities import log2nordb
+
+from norlyst.databaseQueries import GET_DAILY_LIST, GET_EVENT_CLASSIFICATIONS, UPDATE_PRIORITY
+
+MIGRATION_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'migrations')
+
+HOT_QUERIES = [
+    ['GET_DAILY_LIST', GET_DAILY_LIST],
+    ['GET_EVENT_CLASSIFICATIONS', GET_EVENT_CLASSIFICATIONS],
+    ['UPDATE_PRIORITY', UPDATE_PRIORITY],
+]
+
+EXPLAIN_PARAMETERS = {
+    'daily_list_date': date.today(),
+    'daily_list_id': 1,
+    'event_classification_id': 1,
+    'priority': -1,
+}
+
+INDEX_SCAN_TYPES = ['Index Scan', 'Index Only Scan', 'Bitmap Index Scan']
+
+CREATE_MIGRATION_TABLE = """
+    CREATE TABLE IF NOT EXISTS norlyst_migration(
+        version INTEGER PRIMARY KEY,
+        name TEXT,
+        applied_at TIMESTAMP DEFAULT NOW()
+    )
+"""
+
+GET_APPLIED_MIGRATIONS = """
+    SELECT
+        version
+    FROM
+        norlyst_migration
+"""
+
+INSERT_MIGRATION = """
+    INSERT INTO
+        norlyst_migration
+        (version, name)
+    VALUES
+        (%(version)s, %(name)s)
+"""
+
+def getMigrations():
+    """
+    Function for listing the migration files in the migrations folder. Returns a list of [version, name, path] sorted by version.
+    """
+    migrations = []
+
+    for filename in os.listdir(MIGRATION_PATH):
+        if not filename.endswith('.sql'):
+            continue
+
+        version = int(filename.split('_')[0])
+        migrations.append([version, filename[:-4], os.path.join(MIGRATION_PATH, filename)])
+
+    migrations.sort(key = lambda x: x[0])
+
+    return migrations
+
+def applyMigrations(conn):
+    """
+    Function for applying all migrations that have not been applied yet. Each migration is run in its own transaction. Returns the names of the applied migrations.
+    """
+    cur = conn.cursor()
+
+    cur.execute(CREATE_MIGRATION_TABLE)
+    conn.commit()
+
+    cur.execute(GET_APPLIED_MIGRATIONS)
+    applied_versions = {ans[0] for ans in cur.fetchall()}
+
+    applied_migrations = []
+
+    for version, name, path in getMigrations():
+        if version in applied_versions:
+            continue
+
+        migration_file = open(path, 'r')
+        migration_sql = migration_file.read()
+        migration_file.close()
+
+        try:
+            cur.execute(migration_sql)
+            cur.execute(INSERT_MIGRATION, {'version': version, 'name': name})
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        applied_migrations.append(name)
+
+    return applied_migrations
+
+def getPlanScans(plan):
+    """
+    Function for collecting [node type, relation name, index name] of every scan node in a json query plan
+    """
+    scans = []
+
+    if plan['Node Type'].endswith('Scan'):
+        scans.append([plan['Node Type'], plan.get('Relation Name'), plan.get('Index Name')])
+
+    for sub_plan in plan.get('Plans', []):
+        scans.extend(getPlanScans(sub_plan))
+
+    return scans
+
+def explainHotQueries(conn):
+    """
+    Function for checking the query plans of the hot queries of NorLyst. Sequential scans are disabled for the check so that the result does not depend on the current size of the tables. Returns True if every scan of every query uses an index.
+    """
+    cur = conn.cursor()
+    all_indexed = True
+
+    try:
+        cur.execute('SET LOCAL enable_seqscan = off')
+
+        for query_name, query in HOT_QUERIES:
+            cur.execute('EXPLAIN (FORMAT JSON) ' + query, EXPLAIN_PARAMETERS)
+            plan = cur.fetchone()[0]
+
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+
+            print(query_name)
+            for node_type, relation_name, index_name in getPlanScans(plan[0]['Plan']):
+                if node_type in INDEX_SCAN_TYPES:
+                    print('    {0} on {1} using {2}'.format(node_type, relation_name, index_name))
+                else:
+                    print('    {0} on {1} - NO INDEX'.format(node_type, relation_name))
+                    all_indexed = False
+    finally:
+        conn.rollback()
+
+    return all_indexed
+
+def run():
+    parser = argparse.ArgumentParser(description = 'Apply pending NorLyst schema migrations.')
+    parser.add_argument('--explain', action = 'store_true', help = 'check that the hot queries of NorLyst use the indexes')
+    args = parser.parse_args()
+
+    conn = log2nordb()
+
+    try:
+        if args.explain:
+            if not explainHotQueries(conn):
+                sys.exit(1)
+        else:
+            applied_migrations = applyMigrations(conn)
+
+            if applied_migrations:
+                for name in applied_migrations:
+                    print('Applied migration {0}'.format(name))
+            else:
+                print('No pending migrations')
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,12 @@
+/*
+ Indexes for the lookups NorLyst does on every date change and every update.
+
+-daily_list is searched by daily_list_date and there should only be one list per date
+-event_classification is searched by daily_id when a daily list is opened and by id and event_id when it is updated
+ */
+
+CREATE UNIQUE INDEX IF NOT EXISTS daily_list_date_idx ON daily_list (daily_list_date);
+
+CREATE INDEX IF NOT EXISTS event_classification_daily_id_idx ON event_classification (daily_id);
+
+CREATE INDEX IF NOT EXISTS event_classification_event_id_idx ON event_classification (event_id);
@@ -0,0 +1,166 @@
+"""
+This module contains the local on-disk store of the waveforms of recently viewed events.
+"""
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+import numpy
+
+from obspy import Trace, UTCDateTime
+
+from norlyst.config import WAVEFORM_STORE_PATH, WAVEFORM_STORE_MAX_SIZE
+
+class WaveformStore():
+    """
+    This class stores the traces of an event as raw numpy arrays in a folder named by the event id. Each folder has an index file with the stats of the traces and a fingerprint of the picks the traces were trimmed with. Traces are read back as memory maps so they are not copied to memory, and the store is kept under max_size bytes by removing the least recently used events.
+    """
+    def __init__(self, store_path = WAVEFORM_STORE_PATH, max_size = WAVEFORM_STORE_MAX_SIZE):
+        os.makedirs(store_path, exist_ok = True)
+
+        self.store_path = store_path
+        self.max_size = max_size
+        self.__lock = threading.Lock()
+
+    def getEventWaveforms(self, event):
+        """
+        Function for reading the waveforms of an event from the store. Returns a dictionary of station and trace list pairs or None if the event is not stored or was stored with different picks.
+        """
+        event_path = self.__getEventPath(event.event_id)
+        index_path = os.path.join(event_path, INDEX_FILE_NAME)
+
+        with self.__lock:
+            if not os.path.exists(index_path):
+                return None
+
+            try:
+                index_file = open(index_path, 'r')
+                index = json.load(index_file)
+                index_file.close()
+
+                if index['fingerprint'] != getPickFingerprint(event):
+                    return None
+
+                ordered_waveforms = {}
+                for trace_info in index['traces']:
+                    data = numpy.load(os.path.join(event_path, trace_info['file_name']), mmap_mode = 'r')
+
+                    tr = Trace(data = data, header = {
+                        'network': trace_info['network'],
+                        'station': trace_info['station'],
+                        'location': trace_info['location'],
+                        'channel': trace_info['channel'],
+                        'starttime': UTCDateTime(trace_info['starttime']),
+                        'sampling_rate': trace_info['sampling_rate'],
+                    })
+
+                    if tr.stats['station'] not in ordered_waveforms.keys():
+                        ordered_waveforms[tr.stats['station']] = []
+                    ordered_waveforms[tr.stats['station']].append(tr)
+            except (OSError, ValueError, KeyError) as e:
+                print('Reading stored waveforms of event {0} failed: {1}'.format(event.event_id, e))
+                shutil.rmtree(event_path, ignore_errors = True)
+                return None
+
+            os.utime(index_path)
+
+        return ordered_waveforms
+
+    def putEventWaveforms(self, event, ordered_waveforms):
+        """
+        Function for storing the waveforms of an event. The event is written to a temporary folder first so that a partially written event is never read. Evicts the least recently used events if the store grows over its size limit.
+        """
+        event_path = self.__getEventPath(event.event_id)
+        temp_path = event_path + '.tmp{0}'.format(threading.get_ident())
+
+        shutil.rmtree(temp_path, ignore_errors = True)
+        os.makedirs(temp_path)
+
+        index = {'fingerprint': getPickFingerprint(event), 'traces': []}
+
+        try:
+            counter = 0
+            for traces in ordered_waveforms.values():
+                for tr in traces:
+                    file_name = '{0}.{1}.{2}.npy'.format(tr.stats['station'], tr.stats['channel'], counter)
+                    counter += 1
+
+                    numpy.save(os.path.join(temp_path, file_name), numpy.ascontiguousarray(tr.data))
+
+                    index['traces'].append({
+                        'file_name': file_name,
+                        'network': tr.stats['network'],
+                        'station': tr.stats['station'],
+                        'location': tr.stats['location'],
+                        'channel': tr.stats['channel'],
+                        'starttime': str(tr.stats['starttime']),
+                        'sampling_rate': tr.stats['sampling_rate'],
+                    })
+
+            index_file = open(os.path.join(temp_path, INDEX_FILE_NAME), 'w')
+            json.dump(index, index_file)
+            index_file.close()
+        except OSError as e:
+            print('Storing waveforms of event {0} failed: {1}'.format(event.event_id, e))
+            shutil.rmtree(temp_path, ignore_errors = True)
+            return
+
+        with self.__lock:
+            shutil.rmtree(event_path, ignore_errors = True)
+            os.rename(temp_path, event_path)
+            self.__evict()
+
+    def removeEvent(self, event_id):
+        """
+        Function for removing an event from the store
+        """
+        with self.__lock:
+            shutil.rmtree(self.__getEventPath(event_id), ignore_errors = True)
+
+    def __getEventPath(self, event_id):
+        """
+        Get the folder of the event in the store
+        """
+        return os.path.join(self.store_path, str(event_id))
+
+    def __evict(self):
+        """
+        Remove the least recently used events until the store fits in its size limit
+        """
+        stored_events = []
+        store_size = 0
+
+        for folder_name in os.listdir(self.store_path):
+            event_path = os.path.join(self.store_path, folder_name)
+            index_path = os.path.join(event_path, INDEX_FILE_NAME)
+
+            if not folder_name.isdigit() or not os.path.exists(index_path):
+                continue
+
+            event_size = sum(entry.stat().st_size for entry in os.scandir(event_path))
+            stored_events.append([os.path.getmtime(index_path), event_path, event_size])
+            store_size += event_size
+
+        if store_size <= self.max_size:
+            return
+
+        stored_events.sort(key = lambda x: x[0])
+
+        for last_access, event_path, event_size in stored_events:
+            if store_size <= self.max_size:
+                break
+
+            shutil.rmtree(event_path, ignore_errors = True)
+            store_size -= event_size
+
+def getPickFingerprint(event):
+    """
+    Function for calculating a fingerprint of the picks of an event. The stored traces are trimmed by the picks, so they are not used if the picks have changed.
+    """
+    picks = sorted([str(pick.station_code), str(pick.observation_time)] for pick in event.data)
+
+    return hashlib.md5(json.dumps(picks).encode('utf-8')).hexdigest()
+
+INDEX_FILE_NAME = 'index.json'
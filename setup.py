@@ -27,5 +27,6 @@ setup(
     entry_points = '''
         [console_scripts]
         norlyst=norlyst.main:run
+        norlyst-migrate=norlyst.sql.migrate:run
     ''',
 )
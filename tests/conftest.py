@@ -0,0 +1,98 @@
+"""
+Shared fixtures of the NorLyst tests
+"""
+import os
+import uuid
+
+import pytest
+
+NORLYST_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'norlyst')
+
+PREREQUISITE_TABLES = """
+    CREATE TABLE nordic_event(
+        id SERIAL PRIMARY KEY,
+        solution_type VARCHAR(6)
+    );
+
+    CREATE TABLE nordic_header_main(
+        id SERIAL PRIMARY KEY,
+        event_id INTEGER REFERENCES nordic_event(id),
+        origin_date DATE,
+        origin_time TIME
+    );
+
+    CREATE TABLE nordic_header_waveform(
+        id SERIAL PRIMARY KEY,
+        event_id INTEGER REFERENCES nordic_event(id),
+        waveform_info VARCHAR(80)
+    );
+
+    CREATE TABLE nordb_user(
+        username VARCHAR(32) PRIMARY KEY
+    );
+"""
+
+TEST_ROLES = ['default_users', 'norlyst_test_analyst', 'norlyst_test_other']
+
+@pytest.fixture(scope = 'session')
+def postgres_uri(tmp_path_factory):
+    """
+    URI of a PostgreSQL server for the tests. NORLYST_TEST_DATABASE_URL is used if it is set, otherwise a throwaway server is started with pgserver.
+    """
+    if os.environ.get('NORLYST_TEST_DATABASE_URL'):
+        yield os.environ['NORLYST_TEST_DATABASE_URL']
+        return
+
+    pgserver = pytest.importorskip('pgserver')
+    server = pgserver.get_server(str(tmp_path_factory.mktemp('pgdata')), cleanup_mode = 'stop')
+
+    yield server.get_uri()
+
+@pytest.fixture(scope = 'session')
+def norlyst_database(postgres_uri):
+    """
+    URI of a throwaway database with the NorLyst tables of sql/make_tables.sql and the migrations. The database is dropped after the tests.
+    """
+    psycopg2 = pytest.importorskip('psycopg2')
+    from psycopg2.extensions import make_dsn, parse_dsn
+
+    database_name = 'norlyst_test_{0}'.format(uuid.uuid4().hex[:8])
+
+    admin_conn = psycopg2.connect(postgres_uri)
+    admin_conn.autocommit = True
+    admin_cur = admin_conn.cursor()
+    admin_cur.execute('CREATE DATABASE {0}'.format(database_name))
+
+    for role in TEST_ROLES:
+        admin_cur.execute('SELECT 1 FROM pg_roles WHERE rolname = %s', (role,))
+        if admin_cur.fetchone() is None:
+            admin_cur.execute('CREATE ROLE {0}'.format(role))
+
+    database_uri = make_dsn(**dict(parse_dsn(postgres_uri), dbname = database_name))
+
+    conn = psycopg2.connect(database_uri)
+    cur = conn.cursor()
+
+    cur.execute(PREREQUISITE_TABLES)
+
+    sql_path = os.path.join(NORLYST_PATH, 'sql')
+    migration_path = os.path.join(sql_path, 'migrations')
+    sql_files = [os.path.join(sql_path, 'make_tables.sql')]
+    sql_files += [os.path.join(migration_path, filename) for filename in sorted(os.listdir(migration_path)) if filename.endswith('.sql')]
+
+    for sql_file_path in sql_files:
+        sql_file = open(sql_file_path, 'r')
+        cur.execute(sql_file.read())
+        sql_file.close()
+
+    for role in TEST_ROLES[1:]:
+        cur.execute('GRANT default_users TO {0}'.format(role))
+        cur.execute('GRANT SELECT ON nordic_event, nordb_user TO {0}'.format(role))
+
+    conn.commit()
+    conn.close()
+
+    yield database_uri
+
+    admin_cur.execute('DROP DATABASE {0}'.format(database_name))
+    admin_conn.close()
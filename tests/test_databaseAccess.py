@@ -0,0 +1,253 @@
+"""
+Tests for the lock checking UPDATE statements of norlyst.databaseQueries. The statements are run against a throwaway PostgreSQL database as an analyst with a day locked to them, a day locked to another analyst and an unlocked day, and compared with the correlated sub-select statements they replaced.
+"""
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+from psycopg2.extras import execute_values
+
+from norlyst import databaseQueries
+
+ANALYST = 'norlyst_test_analyst'
+OTHER_ANALYST = 'norlyst_test_other'
+
+OWN_LOCK = 'own'
+OTHER_LOCK = 'other'
+NO_LOCK = 'none'
+
+OLD_LOCKED_UPDATE = """
+    UPDATE
+        event_classification
+    SET
+        {0} = {1}
+    WHERE
+        id = %(event_classification_id)s
+    AND
+        (
+        SELECT
+            author_lock = CURRENT_USER
+        FROM
+            daily_list, event_classification
+        WHERE
+            daily_list.id = event_classification.daily_id
+        AND
+            event_classification.id = %(event_classification_id)s
+        )
+    RETURNING
+        True
+"""
+
+OLD_GET_LOCKED_EVENT_CLASSIFICATIONS = """
+    SELECT
+        event_classification.id
+    FROM
+        daily_list, event_classification
+    WHERE
+        daily_list.id = event_classification.daily_id
+    AND
+        event_classification.id = ANY(%(event_classification_ids)s)
+    AND
+        author_lock = CURRENT_USER
+    FOR SHARE OF
+        daily_list
+"""
+
+SINGLE_UPDATES = [
+    ['UPDATE_ANALYSIS_ID', 'analysis_id', {'analysis_id': 42}],
+    ['UPDATE_PRIORITY', 'priority', {'priority': 7}],
+    ['UPDATE_USERNAME', 'username', {'username': ANALYST}],
+    ['UPDATE_UNIMPORTANT', 'unimportant', {'unimportant': True}],
+    ['UPDATE_DONE', 'done', {}],
+]
+
+BATCH_UPDATES = [
+    ['BATCH_UPDATE_ANALYSIS_ID', 'analysis_id', 42],
+    ['BATCH_UPDATE_PRIORITY', 'priority', 7],
+    ['BATCH_UPDATE_USERNAME', 'username', ANALYST],
+    ['BATCH_UPDATE_UNIMPORTANT', 'unimportant', True],
+    ['BATCH_UPDATE_DONE', 'done', True],
+]
+
+def oldSingleUpdate(column):
+    """
+    Function for creating the correlated sub-select version of a single row update
+    """
+    if column == 'done':
+        return OLD_LOCKED_UPDATE.format(column, 'True')
+    return OLD_LOCKED_UPDATE.format(column, '%({0})s'.format(column))
+
+@pytest.fixture
+def lock_days(norlyst_database):
+    """
+    Create a day locked to the analyst, a day locked to another analyst and an unlocked day with two event classifications each. Returns a connection of the analyst and a dictionary of lock and event classification id list pairs.
+    """
+    admin_conn = psycopg2.connect(norlyst_database)
+    admin_cur = admin_conn.cursor()
+    admin_cur.execute('TRUNCATE event_classification, daily_list, nordb_user, nordic_event CASCADE')
+    admin_cur.execute('INSERT INTO nordb_user (username) VALUES (%s), (%s)', (ANALYST, OTHER_ANALYST))
+
+    event_classification_ids = {}
+    for days_ago, (lock, author_lock) in enumerate([[OWN_LOCK, ANALYST], [OTHER_LOCK, OTHER_ANALYST], [NO_LOCK, None]]):
+        admin_cur.execute(INSERT_DAILY_LIST, {'author_lock': author_lock, 'days_ago': days_ago})
+        daily_id = admin_cur.fetchone()[0]
+
+        event_classification_ids[lock] = []
+        for i in range(2):
+            admin_cur.execute(INSERT_EVENT_CLASSIFICATION, {'daily_id': daily_id})
+            event_classification_ids[lock].append(admin_cur.fetchone()[0])
+
+    admin_conn.commit()
+    admin_conn.close()
+
+    conn = psycopg2.connect(norlyst_database)
+    conn.cursor().execute('SET ROLE {0}'.format(ANALYST))
+    conn.commit()
+
+    yield conn, event_classification_ids
+
+    conn.close()
+
+def getClassificationState(cur):
+    """
+    Function for reading the updatable columns of all event classifications
+    """
+    cur.execute(GET_CLASSIFICATION_STATE)
+    return cur.fetchall()
+
+@pytest.mark.parametrize('statement, column, values', SINGLE_UPDATES)
+@pytest.mark.parametrize('lock', [OWN_LOCK, OTHER_LOCK, NO_LOCK])
+def test_single_update_only_writes_own_locked_days(lock_days, statement, column, values, lock):
+    conn, event_classification_ids = lock_days
+    cur = conn.cursor()
+    event_classification_id = event_classification_ids[lock][0]
+
+    state_before = getClassificationState(cur)
+    cur.execute(getattr(databaseQueries, statement), dict(values, event_classification_id = event_classification_id))
+    ans = cur.fetchone()
+    state_after = getClassificationState(cur)
+    conn.rollback()
+
+    changed_rows = [before[0] for before, after in zip(state_before, state_after) if before != after]
+
+    if lock == OWN_LOCK:
+        assert ans == (True,)
+        assert changed_rows == [event_classification_id]
+    else:
+        assert ans is None
+        assert changed_rows == []
+
+@pytest.mark.parametrize('statement, column, values', SINGLE_UPDATES)
+@pytest.mark.parametrize('lock', [OWN_LOCK, OTHER_LOCK, NO_LOCK])
+def test_single_update_matches_correlated_sub_select(lock_days, statement, column, values, lock):
+    conn, event_classification_ids = lock_days
+    cur = conn.cursor()
+    params = dict(values, event_classification_id = event_classification_ids[lock][0])
+
+    results = []
+    for sql in [getattr(databaseQueries, statement), oldSingleUpdate(column)]:
+        cur.execute(sql, params)
+        results.append([cur.fetchall(), getClassificationState(cur)])
+        conn.rollback()
+
+    assert results[0] == results[1]
+
+@pytest.mark.parametrize('statement, column, value', BATCH_UPDATES)
+def test_batch_update_only_writes_own_locked_days(lock_days, statement, column, value):
+    conn, event_classification_ids = lock_days
+    cur = conn.cursor()
+    all_ids = sorted(sum(event_classification_ids.values(), []))
+
+    state_before = getClassificationState(cur)
+    updated_ids = execute_values(cur, getattr(databaseQueries, statement), [[ec_id, value] for ec_id in all_ids], fetch = True)
+    state_after = getClassificationState(cur)
+    conn.rollback()
+
+    changed_rows = [before[0] for before, after in zip(state_before, state_after) if before != after]
+
+    assert sorted(ans[0] for ans in updated_ids) == event_classification_ids[OWN_LOCK]
+    assert changed_rows == event_classification_ids[OWN_LOCK]
+
+@pytest.mark.parametrize('statement, column, value', BATCH_UPDATES)
+def test_batch_update_matches_correlated_sub_select(lock_days, statement, column, value):
+    conn, event_classification_ids = lock_days
+    cur = conn.cursor()
+    all_ids = sorted(sum(event_classification_ids.values(), []))
+
+    updated_ids = execute_values(cur, getattr(databaseQueries, statement), [[ec_id, value] for ec_id in all_ids], fetch = True)
+    new_result = [sorted(ans[0] for ans in updated_ids), getClassificationState(cur)]
+    conn.rollback()
+
+    cur.execute(OLD_GET_LOCKED_EVENT_CLASSIFICATIONS, {'event_classification_ids': all_ids})
+    locked_ids = sorted(ans[0] for ans in cur.fetchall())
+    for ec_id in locked_ids:
+        cur.execute(oldSingleUpdate(column), {'event_classification_id': ec_id, column: value})
+    old_result = [locked_ids, getClassificationState(cur)]
+    conn.rollback()
+
+    assert new_result == old_result
+
+class FakeConnectionPool():
+    """
+    Connection pool that always hands out the same connection
+    """
+    def __init__(self, conn):
+        self.conn = conn
+
+    def getConnection(self):
+        return self.conn
+
+    def putConnection(self, conn, discard = False):
+        pass
+
+    def closeAll(self):
+        pass
+
+def test_batch_update_returns_lock_result_of_every_update(lock_days):
+    database_access = pytest.importorskip('norlyst.databaseAccess')
+    from norlyst.misc import UpdateQueue
+
+    conn, event_classification_ids = lock_days
+    accesser = database_access.DatabaseAccesser(connection_pool = FakeConnectionPool(conn), use_event_cache = False)
+
+    update_events = []
+    expected = []
+    for lock in [OWN_LOCK, OTHER_LOCK, NO_LOCK]:
+        for ec_id in event_classification_ids[lock]:
+            update_events.append([UpdateQueue.PRIORITY_UPDATE_OPERATION, ec_id, 5])
+            update_events.append([UpdateQueue.DONE_UPDATE_OPERATION, ec_id, True])
+            expected += [lock == OWN_LOCK] * 2
+
+    assert accesser.batchUpdate(update_events) == expected
+
+    cur = conn.cursor()
+    for ec_id, priority, analysis_id, username, unimportant, done in getClassificationState(cur):
+        own_row = ec_id in event_classification_ids[OWN_LOCK]
+        assert (priority == 5) == own_row
+        assert done == own_row
+
+INSERT_DAILY_LIST = """
+    INSERT INTO
+        daily_list (author_lock, daily_list_date)
+    VALUES
+        (%(author_lock)s, CURRENT_DATE - %(days_ago)s)
+    RETURNING
+        id
+"""
+
+INSERT_EVENT_CLASSIFICATION = """
+    INSERT INTO
+        event_classification (daily_id, priority, analysis_id, unimportant, done)
+    VALUES
+        (%(daily_id)s, 1, -1, False, False)
+    RETURNING
+        id
+"""
+
+GET_CLASSIFICATION_STATE = """
+    SELECT
+        id, priority, analysis_id, username, unimportant, done
+    FROM
+        event_classification
+    ORDER BY
+        id
+"""
@@ -0,0 +1,138 @@
+"""
+Tests for resolving the events of an AutomLysti detection file with the per-line and the bulk reader of norlyst.sql.detection_reader
+"""
+from datetime import datetime
+
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+pytest.importorskip('nordb')
+
+from norlyst.sql import detection_reader
+
+FILE_DATE = datetime(2020, 1, 1)
+
+def createMainHeaderLine(origin_time):
+    """
+    Function for creating a nordic main header line of an automatic detection
+    """
+    line = ' {0:%Y} {1:2d}{2:2d} {0:%H%M} {3:4.1f} L  60.123  25.456 10.0  HEL  5 0.5 2.1LHEL'.format(
+        origin_time, origin_time.month, origin_time.day, origin_time.second + origin_time.microsecond / 1000000.0
+    )
+    return line.ljust(79) + '1'
+
+def createDetectionFile(automatic_times):
+    """
+    Function for creating the contents of a detection file with one automatic detection per type and a FINA detection at 12:00
+    """
+    lines = []
+
+    for type_number, (origin_time, class_line) in enumerate(automatic_times, 1):
+        lines.append('{0}) detections of type {0}'.format(type_number))
+        lines.append(createMainHeaderLine(origin_time))
+        lines.append(' station line')
+        lines.append(class_line)
+
+    lines.append('4) FINA    12.00.00.0')
+    lines.append('2020001.wfdisc')
+
+    return '\n'.join(lines) + '\n'
+
+DETECTIONS = [
+    [datetime(2020, 1, 1, 12, 3, 45, 300000), ''],
+    [datetime(2020, 1, 1, 12, 10, 1, 200000), 'class line HEL 0.8 0.9'],
+    [datetime(2020, 1, 1, 23, 59, 59), ''],
+]
+
+DATABASE_EVENTS = [
+    ['A', datetime(2020, 1, 1, 12, 3, 45, 300000)],
+    ['A', datetime(2020, 1, 1, 12, 10, 0)],
+    ['FINA', datetime(2020, 1, 1, 12, 10, 1, 200000)],
+    ['A', datetime(2020, 1, 1, 12, 10, 4)],
+    ['A', datetime(2020, 1, 2, 0, 0, 1)],
+    ['FINA', datetime(2020, 1, 1, 12, 0, 0)],
+]
+
+@pytest.fixture
+def detection_database(norlyst_database, tmp_path, monkeypatch):
+    """
+    Fill the nordb tables with DATABASE_EVENTS and the empty username the readers write, and point the detection reader at the test database and a temporary detection file folder. Returns the ids of the events in the order of DATABASE_EVENTS.
+    """
+    conn = psycopg2.connect(norlyst_database)
+    cur = conn.cursor()
+    cur.execute('TRUNCATE error_logs, event_classification, daily_list, nordic_header_waveform, nordic_header_main, nordic_event CASCADE')
+    cur.execute("INSERT INTO nordb_user (username) VALUES ('') ON CONFLICT DO NOTHING")
+
+    event_ids = []
+    for solution_type, origin_time in DATABASE_EVENTS:
+        cur.execute('INSERT INTO nordic_event (solution_type) VALUES (%s) RETURNING id', (solution_type,))
+        event_ids.append(cur.fetchone()[0])
+        cur.execute('INSERT INTO nordic_header_main (event_id, origin_date, origin_time) VALUES (%s, %s, %s)', (event_ids[-1], origin_time.date(), origin_time.time()))
+
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(detection_reader, 'DETECTION_FILE_PATH', str(tmp_path))
+    monkeypatch.setattr(detection_reader, 'log2nordb', lambda: psycopg2.connect(norlyst_database))
+
+    return event_ids
+
+def writeDetectionFile(tmp_path, detections):
+    detection_file = open(str(tmp_path / 'AutomLysti.2020001'), 'w')
+    detection_file.write(createDetectionFile(detections))
+    detection_file.close()
+
+def readResults(norlyst_database):
+    """
+    Function for reading the classifications, waveform headers and error logs written by a reader and clearing them for the next reader
+    """
+    conn = psycopg2.connect(norlyst_database)
+    cur = conn.cursor()
+
+    cur.execute('SELECT event_id, classification, eqex, certainty FROM event_classification ORDER BY classification, event_id')
+    classifications = cur.fetchall()
+    cur.execute('SELECT event_id, waveform_info FROM nordic_header_waveform ORDER BY id')
+    waveform_headers = cur.fetchall()
+    cur.execute('SELECT COUNT(*) FROM error_logs')
+    error_count = cur.fetchone()[0]
+
+    cur.execute('TRUNCATE error_logs, event_classification, daily_list, nordic_header_waveform')
+    conn.commit()
+    conn.close()
+
+    return classifications, waveform_headers, error_count
+
+def readWithBothReaders(norlyst_database):
+    detection_reader.readDetectionFile(FILE_DATE)
+    per_line_results = readResults(norlyst_database)
+
+    conn = detection_reader.log2nordb()
+    detection_reader.bulkReadDetectionFile(FILE_DATE, conn)
+    conn.close()
+    bulk_results = readResults(norlyst_database)
+
+    return per_line_results, bulk_results
+
+def test_per_line_and_bulk_readers_resolve_the_same_events(norlyst_database, detection_database, tmp_path):
+    writeDetectionFile(tmp_path, DETECTIONS)
+
+    per_line_results, bulk_results = readWithBothReaders(norlyst_database)
+
+    assert per_line_results == bulk_results
+    assert per_line_results == (
+        [
+            (detection_database[0], 1, None, None),
+            (detection_database[1], 2, 0.9, '0.9'),
+            (detection_database[4], 3, None, None),
+            (detection_database[5], 4, None, None),
+        ],
+        [(detection_database[5], '2020001.WFDISC')],
+        0
+    )
+
+def test_per_line_and_bulk_readers_log_the_same_missing_event(norlyst_database, detection_database, tmp_path):
+    writeDetectionFile(tmp_path, DETECTIONS[:2] + [[datetime(2020, 1, 1, 18, 0, 0), '']])
+
+    per_line_results, bulk_results = readWithBothReaders(norlyst_database)
+
+    assert per_line_results == bulk_results == ([], [], 1)
@@ -0,0 +1,33 @@
+"""
+Tests for reading broken rows of norlyst.eventCache
+"""
+import sqlite3
+
+from norlyst.eventCache import NordicEventCache
+
+class CachedEvent():
+    """
+    Picklable stand-in for a NordicEvent
+    """
+    def __init__(self, event_id):
+        self.event_id = event_id
+
+def test_unreadable_event_is_dropped_and_refetched(tmp_path):
+    cache_file_path = str(tmp_path / 'event_cache.db')
+    event_cache = NordicEventCache(cache_file_path)
+    event_cache.putEvents([CachedEvent(1), CachedEvent(2)])
+
+    conn = sqlite3.connect(cache_file_path)
+    conn.execute('UPDATE nordic_event_cache SET event_data = ? WHERE event_id = 2', (b'not a pickle',))
+    conn.commit()
+
+    events = event_cache.getEvents([1, 2])
+
+    assert list(events.keys()) == [1]
+    assert events[1].event_id == 1
+    assert conn.execute('SELECT event_id FROM nordic_event_cache').fetchall() == [(1,)]
+    conn.close()
+
+    event_cache.putEvents([CachedEvent(2)])
+
+    assert sorted(event_cache.getEvents([1, 2]).keys()) == [1, 2]
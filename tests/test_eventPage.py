@@ -0,0 +1,99 @@
+"""
+Tests for filling the station list of norlyst.eventPage as the waveforms of the focused event are read
+"""
+import os
+import types
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+QtWidgets = pytest.importorskip('PyQt5.QtWidgets')
+event_page = pytest.importorskip('norlyst.eventPage')
+
+from obspy import Trace, UTCDateTime
+
+STATIONS = {
+    'NEAR': [60.5, 25.0],
+    'MID': [62.0, 25.0],
+    'FAR': [65.0, 25.0],
+    'EDGE': [70.0, 25.0],
+}
+
+@pytest.fixture(scope = 'module')
+def application():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+class FakePage(QtWidgets.QWidget):
+    """
+    Parent of the station list that records the plotted stations
+    """
+    def __init__(self):
+        super(FakePage, self).__init__()
+        self.plotted_stations = []
+        self.waveform_plot_widget = types.SimpleNamespace(setNewTraces = self.setNewTraces)
+        self.spectrogram_batch = types.SimpleNamespace(precompute = lambda: None)
+
+    def setNewTraces(self, plot_waves, event):
+        self.plotted_stations = list(plot_waves.keys())
+
+def createEvent():
+    """
+    Function for creating a stand-in for a NordicEvent at 60 N 25 E
+    """
+    return types.SimpleNamespace(
+        getOriginTime = lambda: types.SimpleNamespace(val = UTCDateTime(2020, 1, 1).datetime),
+        getLatitude = lambda: types.SimpleNamespace(val = 60.0),
+        getLongitude = lambda: types.SimpleNamespace(val = 25.0),
+        data = []
+    )
+
+def createWaveforms(station_names):
+    """
+    Function for creating z-channel traces of the given stations
+    """
+    return {station_name: [Trace(header = {'station': station_name, 'channel': 'HHZ'})] for station_name in station_names}
+
+def getRowStations(station_list):
+    return [station_list.station_list.item(row).text().split('-')[0].strip() for row in range(station_list.station_list.count())]
+
+def getSelectedStations(station_list):
+    return [item.text().split('-')[0].strip() for item in station_list.station_list.selectedItems()]
+
+@pytest.fixture
+def station_list(application, monkeypatch):
+    monkeypatch.setattr(event_page, 'getAllStations', lambda station_date = None: [
+        types.SimpleNamespace(station_code = code, latitude = lat, longitude = lon) for code, (lat, lon) in STATIONS.items()
+    ])
+
+    page = FakePage()
+    yield event_page.StationList(page)
+
+def test_focusing_an_event_fills_the_list_by_distance(station_list):
+    station_list.setCurrentWaveforms(createWaveforms(['FAR', 'UNKNOWN', 'NEAR']), createEvent())
+
+    assert getRowStations(station_list) == ['NEAR', 'FAR', 'UNKNOWN']
+    assert sorted(getSelectedStations(station_list)) == ['FAR', 'NEAR', 'UNKNOWN']
+    assert station_list.parent().plotted_stations == ['NEAR', 'FAR', 'UNKNOWN']
+
+def test_new_stations_keep_the_selection_of_the_user(station_list):
+    station_list.setCurrentWaveforms(createWaveforms(['FAR', 'NEAR']), createEvent())
+
+    station_list.station_list.item(1).setSelected(False)
+    station_list.stationClicked()
+
+    station_list.updateCurrentWaveforms(createWaveforms(['EDGE', 'MID']))
+
+    assert getRowStations(station_list) == ['NEAR', 'MID', 'FAR', 'EDGE']
+    assert getSelectedStations(station_list) == ['NEAR']
+    assert station_list.parent().plotted_stations == ['NEAR']
+
+def test_focusing_another_event_replaces_the_rows(station_list):
+    station_list.setCurrentWaveforms(createWaveforms(['FAR', 'NEAR']), createEvent())
+    station_list.station_list.item(0).setSelected(False)
+    station_list.stationClicked()
+
+    station_list.setCurrentWaveforms(createWaveforms(['EDGE', 'MID']), createEvent())
+
+    assert getRowStations(station_list) == ['MID', 'EDGE']
+    assert sorted(getSelectedStations(station_list)) == ['EDGE', 'MID']
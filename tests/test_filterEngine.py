@@ -0,0 +1,52 @@
+"""
+Tests for the corner frequency handling and the grouped filtering of norlyst.filterEngine
+"""
+import numpy
+import pytest
+
+from obspy import Trace
+
+from norlyst.filterEngine import getFilterSos, filterTraces
+
+@pytest.mark.parametrize('freq_high', [50.0, 50.0 - 1.0e-5])
+def test_bandpass_high_corner_at_nyquist_falls_back_to_highpass(freq_high):
+    sos = getFilterSos("BP", 2.0, freq_high, 100.0, False)
+    highpass_sos = getFilterSos("HP", 0.0, 2.0, 100.0, False)
+
+    assert sos is not None
+    assert numpy.allclose(sos, highpass_sos)
+
+def test_bandpass_high_corner_just_below_nyquist_is_bandpass():
+    sos = getFilterSos("BP", 2.0, 49.0, 100.0, False)
+
+    assert sos is not None
+    assert sos.shape != getFilterSos("HP", 0.0, 2.0, 100.0, False).shape
+
+def test_bandpass_high_corner_above_nyquist_falls_back_to_highpass():
+    sos = getFilterSos("BP", 2.0, 15.0, 20.0, False)
+
+    assert numpy.allclose(sos, getFilterSos("HP", 0.0, 2.0, 20.0, False))
+
+@pytest.mark.parametrize('filter_type, freq_low, freq_high', [["BP", 50.0, 60.0], ["HP", 0.0, 50.0], ["LP", 50.0, 0.0]])
+def test_filters_at_or_above_nyquist_do_nothing(filter_type, freq_low, freq_high):
+    assert getFilterSos(filter_type, freq_low, freq_high, 100.0, False) is None
+
+def test_filter_traces_at_nyquist_does_not_raise():
+    traces = [Trace(data = numpy.random.randn(3000), header = {'sampling_rate': 100.0, 'station': 'TEST'})]
+
+    filtered_traces = filterTraces(["Custom Filter", "BP", 1.0, 50.0, False], traces)
+
+    assert len(filtered_traces) == 1
+    assert numpy.all(numpy.isfinite(filtered_traces[0].data))
+
+def test_filter_traces_keeps_order_of_mixed_groups():
+    traces = [
+        Trace(data = numpy.random.randn(1000), header = {'sampling_rate': 40.0}),
+        Trace(data = numpy.random.randn(2000), header = {'sampling_rate': 100.0}),
+        Trace(data = numpy.random.randn(1000), header = {'sampling_rate': 40.0}),
+    ]
+
+    filtered_traces = filterTraces(["Bandpass 2-15Hz", "BP", 2.0, 15.0, True], traces)
+
+    assert [tr.stats['npts'] for tr in filtered_traces] == [1000, 2000, 1000]
+    assert [tr.stats['sampling_rate'] for tr in filtered_traces] == [40.0, 100.0, 40.0]